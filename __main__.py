@@ -8,7 +8,28 @@ logger = logging.getLogger(__name__)
 parser = argparse.ArgumentParser()
 parser.add_argument('--ui', help="Choose the output UI", type=str,
                     choices=['terminal', 'curses', 'pygame'], default="curses")
-parser.add_argument('--test', type=str, choices=['engine'])
+parser.add_argument('--test', help="Check the engine records and replays games exactly", type=str, choices=['engine'])
+parser.add_argument('--benchmark', help="Run a performance benchmark instead of the game", type=str,
+                    choices=['boards', 'bombs', 'chains', 'distributed', 'environments', 'factories', 'footprint',
+                             'geometry', 'hashing', 'legal', 'observations', 'planner', 'search', 'sightlines', 'turns',
+                             'workers'])
+parser.add_argument('--check', help="Run one of the correctness checks in checks.py, or 'all' of them", type=str,
+                    choices=['all', 'bombs', 'cadence', 'chains', 'distributed', 'environments', 'geometry', 'hashing',
+                             'lava', 'legal', 'observations', 'search', 'seek', 'shapes', 'sightlines', 'snapshots',
+                             'turns', 'workers'])
+parser.add_argument('--simulate', help="Play this many games without a UI and report the results", type=int)
+parser.add_argument('--levels', help="Comma separated levels to simulate (default: all)", type=str)
+parser.add_argument('--seed', help="Seed of the first simulated game", type=int, default=0)
+parser.add_argument('--policy', help="Hero policy for simulated games, by name or as module:function", type=str,
+                    default="wander")
+parser.add_argument('--workers', help="Processes to simulate with (default: one per core)", type=int)
+parser.add_argument('--max-turns', help="Turns after which a simulated game is abandoned", type=int, default=500)
+parser.add_argument('--coordinate', type=int,
+                    help="Hand out this many simulated games to workers over TCP and report the results")
+parser.add_argument('--work', help="Play simulated games for the coordinator at HOST:PORT", type=str)
+parser.add_argument('--host', help="Address the coordinator listens on", type=str, default="127.0.0.1")
+parser.add_argument('--port', help="Port the coordinator listens on", type=int, default=7474)
+parser.add_argument('--batch', help="Games per batch handed to a worker", type=int, default=32)
 
 
 if __name__ == '__main__':
@@ -16,8 +37,32 @@ if __name__ == '__main__':
                         format="%(module)s:%(lineno)d %(levelname)s %(message)s",
                         level="DEBUG")
     results = parser.parse_args(sys.argv[1:])
-    if results.ui == 'curses':
-        cursesUI()
+    if results.coordinate:
+        import cluster
+        levels = [int(level) for level in results.levels.split(",")] if results.levels else None
+        coordinator = cluster.Coordinator(results.coordinate, levels, results.seed, results.policy, results.max_turns,
+                                          results.batch, results.host, results.port)
+        print("Coordinating on %s:%s" % coordinator.address)
+        start = cluster.timer()
+        coordinator.serve().report(cluster.timer() - start)
+        coordinator.close()
+    elif results.work:
+        import cluster
+        host, _, port = results.work.rpartition(":")
+        cluster.work(host, int(port))
+    elif results.simulate:
+        import simulator
+        levels = [int(level) for level in results.levels.split(",")] if results.levels else None
+        simulator.simulate(results.simulate, levels, results.seed, results.policy, results.workers,
+                           results.max_turns).report()
+    elif results.benchmark:
+        import benchmark
+        benchmark.BENCHMARKS[results.benchmark]()
+    elif results.check:
+        import checks
+        checks.run(None if results.check == "all" else [results.check])
     elif results.test == "engine":
-        import engine
-        engine.test()
+        import checks
+        checks.run(checks.ENGINE)
+    elif results.ui == 'curses':
+        cursesUI()
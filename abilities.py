@@ -1,6 +1,6 @@
+import flowfield
 import grid
 from shared import CreateAction
-from copy import copy
 
 import logging
 logger = logging.getLogger(__name__)
@@ -9,38 +9,43 @@ logger = logging.getLogger(__name__)
 class Stab(object):
     @classmethod
     def get_action(cls, actor, state):
-        for target in cls.threatened_cells(actor, state):
-            if target in state and 'health' in state[target] and state[target]['team'] != actor['team']:
+        enemies = cls.threat_mask(actor, state) & state.enemy_mask(actor['team'])
+        for target in state.board.iter_mask(enemies):
+            if 'health' in state[target]:
                 return [CreateAction({"type": "Stab",
                                       "element": actor,
                                       "target": target})]
 
     @classmethod
     def targets(cls, actor, state):
-        results = set()
-        for target, element in state.items():
-            if 'team' not in element or element['team'] != actor['team']:
-                results |= grid.neighbors(target)
-        return results
+        return state.board.to_cells(cls.target_mask(actor, state))
+
+    @classmethod
+    def target_mask(cls, actor, state):
+        return state.board.adjacent_mask(state.occupancy & ~state.ally_mask(actor['team']))
 
     @classmethod
     def threatened_cells(cls, actor, state):
-        return grid.neighbors(state.find(actor))
+        return state.board.neighbor_cells[state.board.index[state.find(actor)]]
 
+    @classmethod
+    def threat_mask(cls, actor, state):
+        return state.board.neighbor_masks[state.board.index[state.find(actor)]]
 
-class Move(object):
 
+class Move(object):
     @classmethod
     def get_action(cls, actor, state):
         try:
-            path = grid.find_path(state, state.find(actor), actor.targets(state))
-            if len(path) > 1:
+            src = state.find(actor)
+            target = flowfield.next_step(state, src, actor.target_mask(state))
+            if target != src:
                 return [CreateAction({"type": "Move",
                                       "element": actor,
-                                      "target": path[1]})]
+                                      "target": target})]
             return [CreateAction({"type": "Null",
                                   "element": actor,
-                                  "target": state.find(actor)})]
+                                  "target": src})]
 
         except grid.NoPathExistsError:
             return None
@@ -57,117 +62,123 @@ class Lunge(object):
 class Shoot(object):
     @classmethod
     def get_action(cls, actor, state):
-        src = state.find(actor)
-
-        blocked = [d for d in grid.DIRECTIONS if grid.add(src, d) in state]
-
-        for i in range(2, 5):
-            for direction in grid.DIRECTIONS:
-                if direction in blocked:    # Don't check cells that have something in the way.
-                    continue
-                target = grid.add(src, grid.mult(direction, i))
-                if target in state and 'health' in state[target] and state[target]['team'] != actor['team']:
-                    return [CreateAction({"type": "Shoot",
-                                          "element": actor,
-                                          "target": target})]
-                elif target in state:
-                    blocked.append(direction)
+        """Shoot the nearest enemy in sight, two to four steps away, trying the directions in order on a tie."""
+        topology = state.board
+        i = topology.index[state.find(actor)]
+
+        best = None
+        for d in range(len(topology.directions)):
+            steps = topology.first(i, d, state.occupancy, 4)
+            if steps > 1 and (best is None or steps < best):  # Can't shoot anything next to you.
+                target = topology.cells[topology.rays[i][d][steps - 1]]
+                if 'health' in state[target] and state[target]['team'] != actor['team']:
+                    best, shot = steps, target
+        if best is not None:
+            return [CreateAction({"type": "Shoot",
+                                  "element": actor,
+                                  "target": shot})]
 
     @classmethod
     def targets(cls, actor, state):
-        results = set()
-        for target, element in state.items():
-            if 'team' not in element or element['team'] == actor['team']:
-                continue
+        return state.board.to_cells(cls.target_mask(actor, state))
 
-            directions = copy(grid.DIRECTIONS)
-            blocked = []
-            for i in range(1, 5):
-                for d in directions:
-                    cell = grid.add(target, grid.mult(d, i))
-                    if d in blocked:
-                        continue
-                    elif cell in state.keys() and cell != state.find(actor):
-                        blocked.append(d)
-                    else:
-                        results.add(cell)
-
-            results -= grid.lines(target, 1)
+    @classmethod
+    def target_mask(cls, actor, state):
+        topology = state.board
+        results = 0
+        blockers = state.occupancy & ~topology.cell_mask(state.find(actor))     # The archer doesn't block its own shots
+        for j in topology.ids(state.enemy_mask(actor['team'])):
+            # Look out from the target in each direction, up to the first thing in the way.
+            for d in range(len(topology.directions)):
+                steps = topology.first(j, d, blockers, 4)
+                results |= topology.ray_mask(j, d, steps - 1 if steps else 4) & ~topology.ray_mask(j, d, 1)
         return results
 
     @classmethod
     def threatened_cells(cls, actor, state):
-        src = state.find(actor)
-        return grid.lines(src, 5) - grid.lines(src, 1)
+        return state.board.to_cells(cls.threat_mask(actor, state))
+
+    @classmethod
+    def threat_mask(cls, actor, state):
+        """The cells two to four steps away in each direction, up to and including the first thing in the way."""
+        topology = state.board
+        i = topology.index[state.find(actor)]
+        results = 0
+        for d in range(len(topology.directions)):
+            steps = topology.first(i, d, state.occupancy, 4)
+            if steps != 1:
+                results |= topology.ray_mask(i, d, steps or 4) & ~topology.ray_mask(i, d, 1)
+        return results
 
 
 class WizardsBeam(object):
     @classmethod
     def get_action(cls, actor, state):
         src = state.find(actor)
-        actor['beam cooldown'] -= 1
-        if actor['beam cooldown'] >= 0:  # Only fire every other turn
+        if actor['beam cooldown'] > 0:  # Only fire every other turn.  Unit.decide ticks the cooldown down.
             return
 
-        for direction in grid.DIRECTIONS:
-            cells = grid.line(src, direction, 5)
-            cells.remove(src)
-            logger.debug("Cells: %s", cells)
-            elements = [state.get(cell) for cell in cells if cell in state]
-            logger.debug("%s sees %s in direction %s", actor, elements, direction)
-            teams = [e['team'] for e in elements if 'team' in e]
-            if actor['team'] in teams:  # Can't shoot Allies
+        topology = state.board
+        i = topology.index[src]
+        allies, enemies = state.ally_mask(actor['team']), state.enemy_mask(actor['team'])
+        for d, direction in enumerate(topology.directions):
+            beam = topology.ray_mask(i, d, 5)
+            if beam & allies:   # Can't shoot Allies
                 logger.debug("%s can't shoot %s or he'll hit an ally", actor, direction)
                 continue
-            elif len(teams) == 0:   # Don't shoot at nothing.
+            elif not beam & enemies:    # Don't shoot at nothing.
                 logger.debug("%s can't shoot %s or he'll miss", actor, direction)
                 continue
             else:
                 return [CreateAction({"type": "WizardsBeam",
                                       "element": actor,
-                                      "target": t}) for t in cells]
+                                      "target": topology.cells[j]}) for j in topology.rays[i][d][:5]]
 
     @classmethod
     def targets(cls, actor, state):
-        results = set()
-        results.add(state.find(actor))
-        return results
+        return state.board.to_cells(cls.target_mask(actor, state))
+
+    @classmethod
+    def target_mask(cls, actor, state):
+        return state.board.cell_mask(state.find(actor))
 
 
 class ThrowBomb(object):
     @classmethod
     def get_action(cls, actor, state):
-        actor['bomb cooldown'] -= 1
-        if actor['bomb cooldown'] >= 0:
+        if actor['bomb cooldown'] > 0:  # Unit.decide ticks the cooldown down.
             return
 
-        for cell in grid.burst(state.find(actor), 3):
-            if cell in state.keys():
-                continue
+        # Throw at the empty cell in range with the lowest id that scores.
+        board = state.board
+        candidates = cls.score_mask(actor, state) & board.burst_mask(board.index[state.find(actor)], 3)
+        candidates &= ~state.occupancy
+        if candidates:
+            return [CreateAction({
+                'type': "ThrowBomb",
+                'element': actor,
+                'target': board.cells[(candidates & -candidates).bit_length() - 1]
+            })]
 
-            # Check who we're targeting
-            neighbors = [state[c] for c in grid.neighbors(cell) if c in state]
-            teams = set(n['team'] for n in neighbors if 'team' in n)
-            if actor['team'] in teams:  # Can't hit allies.
-                continue
-            elif len(teams) == 0:   # Don't target cells where you won't hit anyone.
-                continue
-            else:
-                return [CreateAction({
-                    'type': "ThrowBomb",
-                    'element': actor,
-                    'target': cell
-                })]
+    @classmethod
+    def score_mask(cls, actor, state):
+        """Bitboard of the cells worth bombing, wherever the bomber stands."""
+        # Check who we're targeting.  Don't hit allies, and don't target cells where you won't hit anyone.
+        topology, team = state.board, actor['team']
+        return topology.adjacent_mask(state.enemy_mask(team)) & ~topology.adjacent_mask(state.ally_mask(team))
 
     @classmethod
     def targets(cls, actor, state):
-        targets = set()
-        avoid = set()
-        for cell, element in state.items():
-            if 'team' not in element or actor['team'] != element['team']:
-                targets |= grid.burst(cell, 3) - grid.burst(cell, 2)
-                avoid |= grid.burst(cell, 1)
-        return targets - avoid
+        return state.board.to_cells(cls.target_mask(actor, state))
+
+    @classmethod
+    def target_mask(cls, actor, state):
+        board = state.board
+        others = state.occupancy & ~state.ally_mask(actor['team'])
+        targets = 0
+        for i in board.ids(others):
+            targets |= board.ring_mask(i, 3)
+        return targets & ~(others | board.adjacent_mask(others))
 
 
 class Explode(object):
@@ -179,7 +190,7 @@ class Explode(object):
             'element': actor,
             'target': state.find(actor)
         }))
-        for cell in grid.neighbors(state.find(actor)):
+        for cell in state.board.neighbor_cells[state.board.index[state.find(actor)]]:
             results.append(CreateAction({
                 'type': "BlastWave",
                 'element': actor,
@@ -214,3 +225,29 @@ class Bashable(object):
 
 class Health(object):
     pass
+
+
+class Flags(dict):
+    """A bit for every ability name, given out the first time the name turns up, so a set of abilities is an int and
+       checking for one is a single &."""
+
+    def __missing__(self, name):
+        flag = self[name] = 1 << len(self)
+        return flag
+
+
+FLAGS = Flags()
+RESOLVED = {}   # tuple of ability names -> (flags, ability classes)
+
+
+def resolve(names):
+    """The flags and the ability classes for the ability names :names:, worked out once for each distinct list.  Names
+       with no class here, like the Hero's Bash, only have a flag."""
+    names = tuple(names)
+    resolved = RESOLVED.get(names)
+    if resolved is None:
+        flags = 0
+        for name in names:
+            flags |= FLAGS[name]
+        resolved = RESOLVED[names] = (flags, tuple(globals()[name] for name in names if name in globals()))
+    return resolved
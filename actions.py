@@ -1,12 +1,17 @@
 import utils
-import grid
+import abilities
 from shared import CreateUnit
 
 import logging
 logger = logging.getLogger(__name__)
 
+MOVE = abilities.FLAGS["Move"]
+
+
+class Action(utils.with_metaclass(utils.Registry, utils.Slotted, dict)):
+    registry = "actions"    # Every subclass can be made by name with shared.CreateAction
+    __slots__ = ()          # Actions are dicts, so they save as JSON.  Whatever rollback needs goes in slots.
 
-class Action(dict):
     def __init__(self, *args, **kwargs):
         super(Action, self).__init__(*args, **kwargs)
         self['type'] = self.__class__.__name__
@@ -33,6 +38,8 @@ class Action(dict):
 
 
 class Null(Action):
+    __slots__ = ()
+
     def execute(self, state):
         pass
 
@@ -43,9 +50,26 @@ class Null(Action):
         pass
 
 
+class Cooldown(Action):
+    """Tick one of the element's cooldowns down at the start of its turn."""
+
+    __slots__ = ()
+
+    def execute(self, state):
+        self.element[self['cooldown']] -= 1
+
+    def rollback(self, state):
+        self.element[self['cooldown']] += 1
+
+    def validate(self, state):
+        return self['cooldown'] in self.element
+
+
 class Spawn(Action):
     """Add a new element to the game grid"""
 
+    __slots__ = ()
+
     def __init__(self, *args, **kwargs):
         super(Spawn, self).__init__(self, *args, **kwargs)
         self['element'] = CreateUnit(**kwargs['element'])
@@ -65,6 +89,8 @@ class Spawn(Action):
 
 
 class ThrowBomb(Action):
+    __slots__ = ('bomb', 'cooldown')
+
     def __init__(self, *args, **kwargs):
         super(ThrowBomb, self).__init__(self, *args, **kwargs)
         self.bomb = CreateUnit(type='Bomb')
@@ -80,7 +106,7 @@ class ThrowBomb(Action):
 
         state.actors.remove(self.bomb)
         self.element['bomb cooldown'] = self.cooldown
-        del state[self.bomb]
+        del state[self.target]
 
     def validate(self, state):
         if self.target in state:
@@ -89,20 +115,26 @@ class ThrowBomb(Action):
 
 
 class Move(Action):
+    __slots__ = ('src', 'displaced')
+
     def execute(self, state):
         self.src = state.find(self.element)
+        self.displaced = state.get(self.target)     # Only forced moves land on something, see reactions.burn
         state[self.target] = state.pop(self.src)
 
     def rollback(self, state):
         state[self.src] = state.pop(self.target)
+        if self.displaced is not None:
+            state[self.target] = self.displaced
 
     def validate(self, state):
-        if "Move" not in self.element["abilities"]:
+        if not self.element.flags & MOVE:
             logger.debug("%s does not have the ability to Move")
             return False
-        if self.target not in grid.neighbors(state.find(self.element)):
+        board = state.board
+        if self.target not in board.neighbor_cells[board.index[state.find(self.element)]]:
             return False
-        if self.target not in grid.VALID_CELLS:
+        if self.target not in board.index:
             return False
         if self.target in state:
             logger.debug("%s tried to move to %s, which is occupied by %s",
@@ -112,13 +144,16 @@ class Move(Action):
 
 
 class Jump(Move):
+    __slots__ = ()
+
     def validate(self, state):
-        if "Move" not in self.element["abilities"]:
+        if not self.element.flags & MOVE:
             logger.debug("%s does not have the ability to Move")
             return False
-        if grid.distance(self.target, state.find(self.element)) != 2:
+        board = state.board
+        if tuple(self.target) not in board.index:
             return False
-        if self.target not in grid.VALID_CELLS:
+        if board.distances[board.index[tuple(self.target)]][board.index[state.find(self.element)]] != 2:
             return False
         if self.target in state:
             logger.debug("%s tried to move to %s, which is occupied by %s",
@@ -128,6 +163,7 @@ class Jump(Move):
 
 
 class Attack(Action):
+    __slots__ = ()
     damage = 1
 
     def execute(self, state):
@@ -140,10 +176,12 @@ class Attack(Action):
 
 
 class Stab(Attack):
+    __slots__ = ()
+
     def validate(self, state):
         """Validate that the action doesn't violate any rules."""
-        source = state.find(self.element)
-        if self.target not in grid.neighbors(source):
+        board = state.board
+        if self.target not in board.neighbor_cells[board.index[state.find(self.element)]]:
             return False
         if "team" not in state.get(self.target, {}) or self.element['team'] == state[self.target]['team']:
             return False
@@ -151,62 +189,60 @@ class Stab(Attack):
 
 
 class Slash(Attack):
-    pass
+    __slots__ = ()
 
 
 class Lunge(Attack):
-    pass
+    __slots__ = ()
 
 
 class DeepLunge(Attack):
-    pass
+    __slots__ = ()
 
 
 class Shoot(Attack):
+    __slots__ = ()
+
     def validate(self, state):
-        source = state.find(self.element)
-        direction = grid.unit_vector(source, self.target)
+        topology = state.board
+        source, target = topology.index.get(state.find(self.element)), topology.index.get(tuple(self.target))
 
         # Must be in a straight line along an axis.
-        if direction not in grid.DIRECTIONS:
+        if source is None or target not in topology.aligned[source]:
             return False
 
         # Can't shoot teammates
         if "team" not in state.get(self.target, {}) or self.element['team'] == state[self.target]['team']:
             return False
 
-        for i in range(1, 5):
-            offset = grid.mult(direction, i)
-            cell = grid.add(source, offset)
-
-            if cell not in state:       # Empty cells pass though
-                continue
-            elif cell != self.target:   # Anything in the way of the attack stops it.
-                return False            #
-            elif cell == self.target:
-                if i == 1:              # Special Case: Can't shoot someone next to you.
-                    return False
-                return True             # Foudn the target, and there's nothing in the way.  Shoot it!
-        return False
+        # Special Case: Can't shoot someone next to you, or out of range.  Anything in the way of the attack stops it.
+        direction, steps = topology.aligned[source][target]
+        return 1 < steps <= 4 and topology.first(source, direction, state.occupancy, steps) == steps
 
 
 class WizardsBeam(Attack):
+    __slots__ = ('cooldown',)
+
     def execute(self, state):
         super(WizardsBeam, self).execute(state)
+        self.cooldown = self.element['beam cooldown']
         self.element['beam cooldown'] = 1
 
     def rollback(self, state):
         super(WizardsBeam, self).rollback(state)
-        self.element['beam cooldown'] = -1
+        self.element['beam cooldown'] = self.cooldown
 
 
 class Explode(Action):
+    __slots__ = ('turn_position',)
+
     def execute(self, state):
+        self.turn_position = state.actors.index(self.element)
         state.actors.remove(self.element)
         del state[self.target]
 
     def rollback(self, state):
-        state.actors.insert(0, self.element)
+        state.actors.insert(self.turn_position, self.element)
         state[self.target] = self.element
 
     def validate(self, state):
@@ -214,10 +250,12 @@ class Explode(Action):
 
 
 class BlastWave(Attack):
-    pass
+    __slots__ = ()
 
 
 class Die(Action):
+    __slots__ = ('turn_position',)
+
     def execute(self, state):
         self.turn_position = state.actors.index(self.element)
         state.actors.remove(self.element)
@@ -226,3 +264,21 @@ class Die(Action):
     def rollback(self, state):
         state.actors.insert(self.turn_position, self.element)
         state[self.target] = self.element
+
+
+class Burn(Die):
+    """The element burns up on the lava it was moved onto, leaving the lava in its place."""
+
+    __slots__ = ()
+
+    @property
+    def lava(self):
+        return self['lava']
+
+    def execute(self, state):
+        super(Burn, self).execute(state)
+        state[self.target] = self.lava
+
+    def rollback(self, state):
+        del state[self.target]
+        super(Burn, self).rollback(state)
@@ -0,0 +1,682 @@
+from timeit import default_timer as timer
+import copy
+import multiprocessing
+import random
+
+import abilities
+import cluster
+import engine
+import envpool
+import flowfield
+import grid
+import legal
+import planes
+import planner
+import search
+import shared
+import simulator
+import topology
+import units
+import utils
+import vecenv
+import zobrist
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def report(title, rows):
+    """Print a small table of (name, seconds, count) rows."""
+    print(title)
+    for name, seconds, count in rows:
+        print("  %-14s %9.4fs  %10.1f us/call" % (name, seconds, 1e6 * seconds / max(count, 1)))
+
+
+def populate(rng, enemies, kind="Warrior"):
+    """A state with a Hero and :enemies: units of :kind: scattered across the board."""
+    state = engine.State()
+    cells = rng.sample(grid.VALID_CELLS, enemies + 1)
+    hero = shared.CreateUnit(type="Hero", team="red")
+    state[cells[0]] = hero
+    state.actors.append(hero)
+    for cell in cells[1:]:
+        unit = shared.CreateUnit(type=kind, team="blue")
+        state[cell] = unit
+        state.actors.append(unit)
+    return state
+
+
+class DeepcopyEngine(engine.Engine):
+    """The engine as it used to record turns, deep copying the state to work out reactions.  Kept as a baseline."""
+
+    def record(self, overwrite=False):
+        if overwrite == False and self.future:
+            raise engine.utils.HopliteError("Cannot record a turn when future turns exist")
+
+        actions = self.state.actors[0].get_action(self.state) or []
+        state = copy.deepcopy(self.state)
+
+        turn = []
+        while len(actions) != 0:
+            action = actions.pop(0)
+            reactions = engine.determine_reactions(action, state)
+            actions = reactions + actions
+            action.execute(state)
+            turn.append(action)
+        for action in reversed(turn):   # Actions also change the units they refer to, which aren't copies.
+            action.rollback(state)
+
+        self.future.append(turn)
+        self.fast_forward()
+
+
+def summarize(turns):
+    """The (type, element id, target) of every action, for checking two games recorded the same turns."""
+    return [[(action['type'], action.element['id'], tuple(action.target)) for action in turn] for turn in turns]
+
+
+def play(kind, level, seed, turns):
+    """Play :turns: turns of :level: with the engine class :kind:, returning the game and the seconds spent
+       recording turns."""
+    game = simulator.new_game(level, seed, kind)
+    return game, simulator.run(game, simulator.wander, random, turns)
+
+
+def turns(games=40, turns=200, seed=0):
+    """Compare turn latency of the deep copying engine against the execute/rollback engine."""
+    recorded = 0
+    times = {"deepcopy": 0.0, "rollback": 0.0}
+    for i in range(games):
+        level = 1 + i % 9
+        old, times_old = play(DeepcopyEngine, level, seed + i, turns)
+        new, times_new = play(engine.Engine, level, seed + i, turns)
+        times["deepcopy"] += times_old
+        times["rollback"] += times_new
+        recorded += len(new.past)
+
+    report("Recording %s turns over %s games" % (recorded, games),
+           [(name, times[name], recorded) for name in ("deepcopy", "rollback")])
+    return times
+
+
+def planners(turns=200, enemies=30, seed=0):
+    """Compare full replanning (grid.find_path), shared flow fields and per-unit D* Lite on one long game.  Every
+       round the hero wanders and each enemy steps towards it; all three planners answer every request, and the
+       replanning answer is the one played."""
+    rng = random.Random(seed)
+    state = populate(rng, enemies)
+    planned = planner.Planners()
+    hero = state.actors[0]
+    times = {"replan": 0.0, "flowfield": 0.0, "dstar": 0.0}
+    calls = 0
+
+    for turn in range(turns):
+        src = state.find(hero)
+        free = [cell for cell in grid.neighbors(src) if cell not in state]
+        if free:
+            state[rng.choice(free)] = state.pop(src)
+
+        for actor in state.actors[1:]:
+            src = state.find(actor)
+            goals = actor.target_mask(state)
+            calls += 1
+
+            start = timer()
+            try:
+                path = grid.find_path(state, src, grid.to_cells(goals), rng)
+            except grid.NoPathExistsError:
+                path = None
+            times["replan"] += timer() - start
+
+            start = timer()
+            try:
+                flowfield.next_step(state, src, goals, rng)
+            except grid.NoPathExistsError:
+                pass
+            times["flowfield"] += timer() - start
+
+            start = timer()
+            try:
+                planned.next_step(state, actor, goals, rng)
+            except grid.NoPathExistsError:
+                pass
+            times["dstar"] += timer() - start
+
+            if path and len(path) > 1:
+                state[path[1]] = state.pop(src)
+
+    expanded = sum(p.expanded for p in planned.planners.values())
+    report("Planning %s enemies over %s turns (%s requests, %s D* Lite expansions)"
+           % (enemies, turns, calls, expanded),
+           [(name, times[name], calls) for name in ("replan", "flowfield", "dstar")])
+    return times
+
+
+def environments(games=64, steps=100, seed=0):
+    """Compare stepping :games: games with VecEnv against a loop recording turns on individual engines, both bare
+       (no observations) and encoding each state from scratch after every step.  All three play the same games with
+       the same hero actions: a stream of random legal actions is drawn once on a VecEnv and played back by each."""
+    rng = random.Random(seed)
+    random.seed(seed)
+    env = vecenv.VecEnv(games, seed=seed)
+    env.reset()
+    stream = []
+    for step in range(steps):
+        stream.append(choose(rng, env.action_masks(), games))
+        env.step(stream[-1])
+
+    times = {}
+    random.seed(seed)
+    env = vecenv.VecEnv(games, seed=seed)
+    env.reset()
+    start = timer()
+    for actions in stream:
+        env.step(actions)
+    times["vecenv"] = timer() - start
+
+    def finished(game, hero):
+        return game.complete or game.turn >= env.max_turns or hero['id'] not in game.state.positions
+
+    def new_game(episode):
+        """Like VecEnv.start: set up the game and play it up to the hero's first turn."""
+        game = engine.Engine(engine.generate_level(levels[episode % len(levels)], random.Random(episode)))
+        game.fast_forward()
+        hero = game.current_actor
+        advance(game, hero)
+        return game, hero
+
+    def advance(game, hero):
+        """Record turns until the hero needs to act or the game is over."""
+        while not finished(game, hero):
+            try:
+                game.record()
+            except units.RequiresInput:
+                return
+
+    def act(game, hero, index):
+        """Like VecEnv.play: set the hero's action with index :index: into vecenv.ACTIONS, waiting if it can't."""
+        kind, offset = vecenv.ACTIONS[index]
+        src = game.state.find(hero)
+        target = grid.add(src, offset)
+        if index and (target not in grid.TOPOLOGY.index or target in game.state):
+            kind, target = "Null", src
+        hero.set_next_action(shared.CreateAction({"type": kind, "element": hero, "target": target}))
+
+    levels = env.levels
+    for name, encode in (("record", False), ("record+encode", True)):
+        random.seed(seed)
+        episodes = iter(range(seed, seed + games * (steps + 1)))
+        engines = [new_game(next(episodes)) for g in range(games)]
+        start = timer()
+        for actions in stream:
+            for g, index in enumerate(actions):
+                game, hero = engines[g]
+                act(game, hero, index)
+                advance(game, hero)
+                if finished(game, hero):
+                    engines[g] = game, hero = new_game(next(episodes))
+                if encode:
+                    planes.encode(game.state)
+        times[name] = timer() - start
+
+    report("Stepping %s games %s times (%s hero actions)" % (games, steps, games * steps),
+           [(name, times[name], games * steps) for name in ("record", "record+encode", "vecenv")])
+    return times
+
+
+def observations(games=20, turns=200, seed=0):
+    """Replay recorded games, comparing what it costs per turn to keep the feature planes up to date against
+       encoding them from scratch."""
+    times = {"encode": 0.0, "incremental": 0.0}
+    replayed = 0
+    for game in simulator.replays(games, turns, seed):
+        start, encoding = timer(), 0.0
+        for state in simulator.positions(game):
+            encode = timer()
+            planes.encode(state)
+            encoding += timer() - encode
+        plain = timer() - start - encoding
+
+        game.seek(0)
+        game.state.track_planes()
+        start = timer()
+        for state in simulator.positions(game):
+            state.planes.view()
+        times["incremental"] += timer() - start - plain
+        times["encode"] += encoding
+        replayed += game.turn
+
+    report("Feature planes over %s replayed turns of %s games (cost on top of replaying)" % (replayed, games),
+           [(name, times[name], replayed) for name in ("encode", "incremental")])
+    return times
+
+
+def splice(actions, state, turn):
+    """Play :actions: and their reactions onto :turn: the way the engine used to, splicing each action's reactions
+       onto the front of a list.  Kept as a baseline."""
+    actions = list(actions)
+    while actions:
+        action = actions.pop(0)
+        actions = engine.determine_reactions(action, state) + actions
+        action.execute(state)
+        turn.append(action)
+    return turn
+
+
+def chain(play, size, enemies, seed):
+    """Play a turn of :size: blast waves among :enemies: enemies with :play:, as splice or engine.play do.  Returns
+       the (type, target) of every action played and the seconds taken, leaving the state as it was."""
+    state = populate(random.Random(seed), enemies)
+    bomb = shared.CreateUnit(type="Bomb")
+    blasts = [shared.CreateAction({"type": "BlastWave", "element": bomb,
+                                   "target": grid.VALID_CELLS[i % len(grid.VALID_CELLS)]})
+              for i in range(size)]
+    start = timer()
+    turn = play(blasts, state, [])
+    seconds = timer() - start
+    for action in reversed(turn):
+        action.rollback(state)
+    return [(action['type'], action.target) for action in turn], seconds
+
+
+def chains(sizes=(100, 1000, 10000), enemies=60, seed=0):
+    """Play turns made of long chains of blast waves that kill many units, queuing actions and their reactions in a
+       deque as Engine.resolve does, against splicing each action's reactions onto the front of a list."""
+    rows = []
+    for size in sizes:
+        for name, play in (("list", splice), ("deque", engine.play)):
+            played, seconds = chain(play, size, enemies, seed)
+            rows.append(("%s %d" % (name, size), seconds, len(played)))
+    report("Chains of blast waves and the deaths they cause", rows)
+    return rows
+
+
+def factories(calls=20000, seed=0):
+    """What it costs to create actions and units by name through the registries, against searching the subclasses
+       for the name the way the factories used to."""
+    rng = random.Random(seed)
+    hero = shared.CreateUnit(type="Hero", team="red")
+    kinds = sorted(utils.Registry.classes["actions"])
+    requests = [rng.choice(kinds) for i in range(calls)]
+
+    def scan(name):
+        for klass in utils.all_subclasses(utils.Registry.roots["actions"]):
+            if klass.__name__ == name:
+                return klass
+
+    rows = []
+    start = timer()
+    for name in requests:
+        scan(name)
+    rows.append(("subclass scan", timer() - start, calls))
+    start = timer()
+    for name in requests:
+        utils.Registry.classes["actions"].get(name)
+    rows.append(("registry", timer() - start, calls))
+    start = timer()
+    for name in requests:
+        shared.CreateAction({"type": name, "element": hero, "target": (0, 0)})
+    rows.append(("CreateAction", timer() - start, calls))
+    start = timer()
+    for i in range(calls):
+        shared.CreateUnit(type="Warrior", team="blue")
+    rows.append(("CreateUnit", timer() - start, calls))
+    report("Creating %s actions and units by name" % calls, rows)
+    return rows
+
+
+def allocated(build):
+    """Bytes still allocated after calling :build:, and what it returned.  Needs tracemalloc (Python 3.4 and up); on
+       older Pythons the size is None."""
+    try:
+        import tracemalloc
+    except ImportError:
+        return None, build()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = build()
+        return tracemalloc.get_traced_memory()[0] - before, result
+    finally:
+        tracemalloc.stop()
+
+
+def footprint(games=20, turns=100, count=10000, seed=0):
+    """Memory held per unit, per action and per recorded game, and the time taken to record a turn."""
+    def size(bytes, per):
+        return "n/a" if bytes is None else "%.0f bytes" % (float(bytes) / per)
+
+    hero = shared.CreateUnit(type="Hero", team="red")
+    per_unit, made = allocated(lambda: [shared.CreateUnit(type="Warrior", team="blue") for i in range(count)])
+    per_action, made = allocated(lambda: [shared.CreateAction({"type": "Move", "element": hero, "target": (0, 0)})
+                                          for i in range(count)])
+
+    def play():
+        played = []
+        for i in range(games):
+            game = simulator.new_game(1 + i % 9, seed + i)
+            simulator.run(game, simulator.wander, random.Random(seed + i), turns)
+            played.append(game)
+        return played
+    per_game, played = allocated(play)
+    recorded = sum(game.turn for game in played)
+
+    seconds = 0.0   # Timed again without tracemalloc, which slows everything down
+    for i in range(games):
+        seconds += simulator.run(simulator.new_game(1 + i % 9, seed + i), simulator.wander, random.Random(seed + i),
+                                 turns)
+
+    print("Unit:   %s" % size(per_unit, count))
+    print("Action: %s" % size(per_action, count))
+    print("Game:   %s after %.0f turns" % (size(per_game, games), float(recorded) / games))
+    report("Recording %s turns over %s games" % (recorded, games), [("record", seconds, recorded)])
+    return per_unit, per_action, per_game, seconds
+
+
+def candidates(actor):
+    """Every action :actor: might be asked to take: each kind legal.CHOICES offers aimed at every cell, and waiting."""
+    kinds = ["Null"] + [kind for kind, ability in legal.CHOICES]
+    return [shared.CreateAction({"type": kind, "element": actor, "target": cell})
+            for kind in kinds for cell in grid.VALID_CELLS
+            if kind in ("Null", "Move", "Jump") or 'team' in actor]
+
+
+def legality(games=20, turns=200, seed=0):
+    """Replay recorded games turn by turn, timing validating each candidate action for every actor one at a time
+       against legal.validate_all and legal.legal_actions."""
+    times = {"validate": 0.0, "validate_all": 0.0, "legal_actions": 0.0}
+    checked = 0
+    for game in simulator.replays(games, turns, seed):
+        for state in simulator.positions(game):
+            for actor in state.actors:
+                if actor['id'] not in state.positions:
+                    continue
+                actions = candidates(actor)
+                start = timer()
+                for action in actions:
+                    action.validate(state)
+                times["validate"] += timer() - start
+                start = timer()
+                legal.validate_all(state, actions)
+                times["validate_all"] += timer() - start
+                start = timer()
+                legal.legal_actions(state, actor)
+                times["legal_actions"] += timer() - start
+                checked += 1
+
+    kinds = len(legal.CHOICES) + 1
+    report("Legal actions of %s actors, up to %s candidates each" % (checked, kinds * len(grid.VALID_CELLS)),
+           [(name, times[name], checked) for name in ("validate", "validate_all", "legal_actions")])
+    return times
+
+
+def choose(rng, masks, games):
+    """A random action each hero may take, given the action masks of :games: games."""
+    width = len(vecenv.ACTIONS)
+    return [rng.choice([a for a in range(width) if masks[g * width + a]]) for g in range(games)]
+
+
+def workers(games=64, steps=100, seed=0):
+    """Step :games: games with an EnvPool of one worker up to one per core, against a VecEnv in this process."""
+    rng = random.Random(seed)
+    rows = []
+
+    env = vecenv.VecEnv(games, seed=seed)
+    env.reset()
+    start = timer()
+    for step in range(steps):
+        env.step(choose(rng, env.action_masks(), games))
+    rows.append(("in process", timer() - start, games * steps))
+
+    for count in range(1, multiprocessing.cpu_count() + 1):
+        pool = envpool.EnvPool(games, seed=seed, workers=count)
+        try:
+            pool.reset()
+            start = timer()
+            for step in range(steps):
+                pool.step(choose(rng, pool.action_masks(), games))
+            rows.append(("%d workers" % count, timer() - start, games * steps))
+        finally:
+            pool.close()
+
+    report("Stepping %s games %s times (%s hero actions)" % (games, steps, games * steps), rows)
+    return rows
+
+
+def distributed(games=200, max_turns=200, batch=16, seed=0):
+    """Play :games: games inline, then through a coordinator with one up to one worker process per core on
+       localhost."""
+    start = timer()
+    simulator.simulate(games, seed=seed, workers=1, max_turns=max_turns)
+    rows = [("inline", timer() - start, games)]
+
+    for count in range(1, multiprocessing.cpu_count() + 1):
+        seconds = cluster.local(games, count, seed=seed, max_turns=max_turns, batch=batch)[1]
+        rows.append(("%d workers" % count, seconds, games))
+
+    report("Simulating %s games on localhost" % games, rows)
+    return rows
+
+
+def hashing(games=20, turns=200, seed=0):
+    """Replay recorded games backwards turn by turn, comparing reading the incremental Zobrist hash against hashing
+       from scratch.  Then play the same games three times, without a transposition table and twice sharing one, to
+       see what remembering enemy decisions saves."""
+    times = {"compute": 0.0, "incremental": 0.0}
+    reads = 0
+    for game in simulator.replays(games, turns, seed):
+        game.fast_forward()
+        while game.past:
+            game.step_backward()
+            start = timer()
+            zobrist.compute(game.state)
+            times["compute"] += timer() - start
+            start = timer()
+            game.state.zobrist_key()
+            times["incremental"] += timer() - start
+            reads += 1
+    report("Hashing %s states" % reads, [(name, times[name], reads) for name in ("compute", "incremental")])
+
+    table = zobrist.TranspositionTable()
+    rows = []
+    for name, transpositions in (("no table", None), ("cold table", table), ("warm table", table)):
+        recorded, seconds = 0, 0.0
+        for i in range(games):
+            game = simulator.new_game(1 + i % 9, seed + i)
+            game.state.transpositions = transpositions
+            seconds += simulator.run(game, simulator.wander, random.Random(seed + i), turns)
+            recorded += game.turn
+        rows.append((name, seconds, recorded))
+    report("Recording turns remembering enemy decisions (%s hits, %s misses, %s replaced)"
+           % (table.hits, table.misses, table.replaced), rows)
+    return times
+
+
+def searches(positions=20, budget=0.25, seed=0):
+    """Search for the hero's action in positions from the start of seeded games with each mode, reporting nodes (hero
+       turns simulated) per second."""
+    rows = []
+    for mode in ("deepening", "mcts"):
+        nodes, seconds, depths = 0, 0.0, 0
+        for i in range(positions):
+            game = simulator.new_game(1 + i % 9, seed + i)
+            result = search.Search(mode, budget, rng=random.Random(seed + i))(game.state)
+            nodes += result.nodes
+            seconds += result.seconds
+            depths += result.depth
+        rows.append((mode, seconds, nodes))
+        print("%-10s %8d nodes in %.2fs: %8.1f nodes/sec, mean depth or iterations %.1f"
+              % (mode, nodes, seconds, nodes / seconds, float(depths) / positions))
+    report("Searching %s positions" % positions, rows)
+    return rows
+
+
+def spawns(board, enemies, rng):
+    """An opening turn for :board:, with the hero at its start and :enemies: enemies of every kind scattered about."""
+    kinds = ["Warrior", "Archer", "Mage", "Demolitionist"]
+    cells = rng.sample([cell for cell in board.cells if cell != board.start], enemies)
+    turn = [shared.CreateAction({"type": "Spawn", "target": list(board.start),
+                                 "element": {"type": "Hero", "team": "red"}})]
+    for i, cell in enumerate(cells):
+        turn.append(shared.CreateAction({"type": "Spawn", "target": list(cell),
+                                         "element": {"type": kinds[i % len(kinds)], "team": "blue"}}))
+    return [turn]
+
+
+def boards(radii=(4, 8, 16, 32), enemies=(8, 32, 128, 512), turns=100, seed=0):
+    """Record turns on hexagonal boards of each radius with each number of enemies, reporting how long it takes to
+       build the board and to record a turn as both grow."""
+    for radius in radii:
+        start = timer()
+        board = topology.Board(grid.DIRECTIONS, "hexagon", radius)
+        built = timer() - start
+        rows = []
+        for count in enemies:
+            if count >= board.size // 2:
+                continue
+            rng = random.Random(seed)
+            units.Unit.counters.clear()
+            game = engine.Engine(spawns(board, count, rng), board=board)
+            game.fast_forward()
+            rows.append(("%d enemies" % count, simulator.run(game, simulator.wander, rng, turns), game.turn - 1))
+        report("Hexagon of radius %s, %s cells, built in %.2fs" % (radius, board.size, built), rows)
+
+
+def scan(actor, state):
+    """Where ThrowBomb aimed as it was first written: the first cell grid.burst gives, in set order, that is empty and
+       next to an enemy but no ally.  Kept as a baseline."""
+    for cell in grid.burst(state.find(actor), 3):
+        if cell in state.keys():
+            continue
+
+        neighbors = [state[c] for c in grid.neighbors(cell) if c in state]
+        teams = set(n['team'] for n in neighbors if 'team' in n)
+        if actor['team'] in teams:  # Can't hit allies.
+            continue
+        elif len(teams) == 0:   # Don't target cells where you won't hit anyone.
+            continue
+        else:
+            return cell
+
+
+def bombers(state):
+    """The units on the board of :state: that throw bombs."""
+    return [actor for actor in state.actors
+            if actor['id'] in state.positions and actor.has("ThrowBomb") and 'team' in actor]
+
+
+def bombs(games=20, turns=200, seed=0):
+    """Replay recorded games of the levels with the most Demolitionists, aiming every bomber's bomb at every turn with
+       the original scan and with the scores."""
+    times = {"scan": 0.0, "scores": 0.0}
+    aimed = 0
+    for game in simulator.replays(games, turns, seed, levels=(8, 9)):
+        for state in simulator.positions(game):
+            throwing = bombers(state)
+            start = timer()
+            for actor in throwing:
+                scan(actor, state)
+            times["scan"] += timer() - start
+            start = timer()
+            for actor in throwing:
+                abilities.ThrowBomb.score_mask(actor, state) & grid.burst_mask(state.find(actor), 3) & ~state.occupancy
+            times["scores"] += timer() - start
+            aimed += len(throwing)
+
+    report("Aiming %s bombs" % aimed, [(name, times[name], aimed) for name in ("scan", "scores")])
+    return times
+
+
+def geometry(queries=20000, units=12, seed=0):
+    """Ask for the distances from random cells to random groups of :units: cells one pair at a time and batched,
+       and for the nearest of them with a bitboard."""
+    rng = random.Random(seed)
+    starts = [rng.choice(grid.VALID_CELLS) for i in range(queries)]
+    groups = [rng.sample(grid.VALID_CELLS, units) for i in range(queries)]
+    masks = [grid.to_mask(group) for group in groups]
+    rows = []
+
+    start = timer()
+    for cell, group in zip(starts, groups):
+        [grid.distance(cell, end) for end in group]
+    rows.append(("distance", timer() - start, queries))
+    start = timer()
+    for cell, group in zip(starts, groups):
+        grid.distances(cell, group)
+    rows.append(("distances", timer() - start, queries))
+    start = timer()
+    for cell, mask in zip(starts, masks):
+        grid.nearest(cell, mask)
+    rows.append(("nearest", timer() - start, queries))
+    report("Distances from %s cells to %s others" % (queries, units), rows)
+    return rows
+
+
+def walk(state, cell, direction, distance):
+    """Steps to the first thing in the way from :cell: in :direction:, found by adding up coordinates, or 0"""
+    for i in range(1, distance + 1):
+        if grid.add(cell, grid.mult(direction, i)) in state:
+            return i
+    return 0
+
+
+def sightlines(games=20, turns=200, seed=0):
+    """Replay recorded games turn by turn, looking along every ray from every occupied cell for the first thing in the
+       way, by walking coordinates and with the ray tables, then timing Shoot's targeting."""
+    topology = grid.TOPOLOGY
+    times = {"walk": 0.0, "first": 0.0, "get_action": 0.0, "validate": 0.0}
+    rays = shots = 0
+    for game in simulator.replays(games, turns, seed):
+        for state in simulator.positions(game):
+            cells = [cell for cell in state if cell in topology.index]
+            start = timer()
+            for cell in cells:
+                for direction in grid.DIRECTIONS:
+                    walk(state, cell, direction, 4)
+            times["walk"] += timer() - start
+            start = timer()
+            for cell in cells:
+                for d in range(len(grid.DIRECTIONS)):
+                    topology.first(topology.index[cell], d, state.occupancy, 4)
+            times["first"] += timer() - start
+            rays += len(cells) * len(grid.DIRECTIONS)
+
+            for actor in state.actors:
+                if actor['id'] not in state.positions or 'team' not in actor:
+                    continue
+                candidates = [shared.CreateAction({"type": "Shoot", "element": actor, "target": cell})
+                              for cell in grid.VALID_CELLS]
+                start = timer()
+                abilities.Shoot.get_action(actor, state)
+                times["get_action"] += timer() - start
+                start = timer()
+                for action in candidates:
+                    action.validate(state)
+                times["validate"] += timer() - start
+                shots += 1
+
+    report("First thing in the way along %s rays" % rays,
+           [(name, times[name], rays) for name in ("walk", "first")])
+    report("Shooting for %s actors" % shots, [("get_action", times["get_action"], shots),
+                                              ("validate", times["validate"], shots * len(grid.VALID_CELLS))])
+    return times
+
+
+BENCHMARKS = {
+    "boards": boards,
+    "bombs": bombs,
+    "chains": chains,
+    "distributed": distributed,
+    "hashing": hashing,
+    "legal": legality,
+    "environments": environments,
+    "factories": factories,
+    "footprint": footprint,
+    "geometry": geometry,
+    "observations": observations,
+    "planner": planners,
+    "search": searches,
+    "sightlines": sightlines,
+    "turns": turns,
+    "workers": workers,
+}
@@ -0,0 +1,410 @@
+from timeit import default_timer as timer
+import copy
+import random
+
+import abilities
+import benchmark
+import cluster
+import engine
+import envpool
+import grid
+import legal
+import planes
+import search
+import shared
+import simulator
+import vecenv
+import zobrist
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def turns(games=40, turns=200, seed=0):
+    """The execute/rollback engine records the same turns as the deep copying engine it replaced."""
+    for i in range(games):
+        level = 1 + i % 9
+        old = benchmark.play(benchmark.DeepcopyEngine, level, seed + i, turns)[0]
+        new = benchmark.play(engine.Engine, level, seed + i, turns)[0]
+        if benchmark.summarize(old.past) != benchmark.summarize(new.past):
+            raise AssertionError("Level %s seed %s recorded different turns" % (level, seed + i))
+    return games
+
+
+def layout(state):
+    """Every unit on the board of :state: with its fields, cell by cell, and the turn order."""
+    return [(key, dict(state[key])) for key in sorted(state)], [actor['id'] for actor in state.actors]
+
+
+def seeking(games=10, turns=200, step=13, seed=0):
+    """Seeking to every :step: th turn and then stepping backward to the start passes through the same states as
+       replaying forwards, so restoring a checkpoint brings back units that had died before it as they were."""
+    checked = 0
+    for game in simulator.replays(games, turns, seed):
+        expected = [layout(state) for state in simulator.positions(game)]
+        for turn in range(0, len(expected), step):
+            game.seek(turn)
+            while True:
+                if layout(game.state) != expected[game.turn]:
+                    raise AssertionError("Turn %s differs after seeking to %s and stepping back" % (game.turn, turn))
+                checked += 1
+                if not game.past:
+                    break
+                game.step_backward()
+    return checked
+
+
+def snapshots(games=10, turns=200, seed=0):
+    """Snapshots taken at every turn of replayed games still show the board and the turn order, units' fields
+       included, as they were when they were taken once the games have played on to the end."""
+    checked = 0
+    for game in simulator.replays(games, turns, seed):
+        taken = [(state.snapshot(), layout(state), [dict(actor) for actor in state.actors])
+                 for state in simulator.positions(game)]
+        for turn, (snapshot, cells, actors) in enumerate(taken):
+            if layout(snapshot) != cells or [dict(actor) for actor in snapshot.actors] != actors:
+                raise AssertionError("The snapshot taken on turn %s changed as the game went on" % turn)
+            checked += 1
+    return checked
+
+
+def observations(games=20, turns=200, seed=0):
+    """The feature planes a state keeps match encoding it from scratch, replaying forwards action by action and
+       backwards turn by turn."""
+    def check(state, action=None):
+        if state.planes.view().tobytes() != bytes(planes.encode(state)):
+            raise AssertionError("Planes differ from a fresh encoding before %s" % (action,))
+
+    checked = 0
+    for game in simulator.replays(games, turns, seed):
+        game.state.track_planes()
+        check(game.state)
+        listener = lambda action: check(game.state, action)
+        game.action_listeners.add(listener)
+        game.fast_forward()
+        game.action_listeners.remove(listener)
+        check(game.state)
+        while game.past:
+            game.step_backward()
+            check(game.state)
+            checked += 1
+    return checked
+
+
+def environments(games=16, steps=100, seed=0):
+    """VecEnv's observations match encoding each game's state from scratch after every step."""
+    rng = random.Random(seed)
+    env = vecenv.VecEnv(games, seed=seed)
+    env.reset()
+    stride = len(planes.PLANES) * env.cells
+    for step in range(steps):
+        observations = env.step(benchmark.choose(rng, env.action_masks(), games))[0]
+        for g in range(games):
+            if observations[g * stride:(g + 1) * stride] != planes.encode(env.games[g].state):
+                raise AssertionError("Observations of game %s differ after step %s" % (g, step))
+    return games * steps
+
+
+def workers(games=8, steps=50, workers=2, seed=0):
+    """An EnvPool's workers write the same observations, rewards and action masks into shared memory as playing each
+       worker's slice of the games on a VecEnv in this process."""
+    rng = random.Random(seed)
+    pool = envpool.EnvPool(games, seed=seed, workers=workers)
+    try:
+        pool.reset()
+        played, results = [], []
+        for step in range(steps):
+            actions = benchmark.choose(rng, pool.action_masks(), games)
+            observations, rewards = pool.step(actions)[:2]
+            played.append(actions)
+            results.append((observations.tobytes(), list(rewards), list(pool.action_masks())))
+    finally:
+        pool.close()
+
+    stride, width = len(planes.PLANES) * grid.TOPOLOGY.size, len(vecenv.ACTIONS)
+    for w in range(workers):
+        first, last = games * w // workers, games * (w + 1) // workers
+        random.seed(seed + w)
+        env = vecenv.VecEnv(last - first, seed=seed + w, stride=workers)
+        env.reset()
+        for step, actions in enumerate(played):
+            observations, rewards = env.step(actions[first:last])[:2]
+            expected = results[step]
+            if (bytes(observations) != expected[0][first * stride:last * stride] or
+                    list(rewards) != expected[1][first:last] or
+                    list(env.action_masks()) != expected[2][first * width:last * width]):
+                raise AssertionError("Worker %s played games %s-%s differently at step %s" % (w, first, last - 1, step))
+    return games * steps
+
+
+def chains(sizes=(100, 1000), enemies=60, seed=0):
+    """Queuing actions and their reactions in a deque plays the same turns as splicing them onto a list."""
+    for size in sizes:
+        played = [benchmark.chain(play, size, enemies, seed)[0] for play in (benchmark.splice, engine.play)]
+        if played[0] != played[1]:
+            raise AssertionError("The queues played different turns for a chain of %s" % size)
+    return len(sizes)
+
+
+def lava(games=40, seed=0):
+    """A unit moved onto lava burns up and leaves the lava where it was, and stepping back over the turn puts
+       everything back as it was, turn order, position index and hash included."""
+    rng = random.Random(seed)
+    burned = 0
+    for i in range(games):
+        game = simulator.new_game(1 + i % 9, seed + i)
+        state, board = game.state, game.state.board
+        actor = rng.choice(state.actors)
+        free = sorted(board.neighbor_cells[board.index[state.find(actor)]] - set(state))
+        if not free:
+            continue
+        cell = rng.choice(free)
+        state[cell] = pool = shared.CreateUnit(type="Lava")
+        before = layout(state), dict(state.positions), state.zobrist_key()
+
+        turn = game.resolve([shared.CreateAction({"type": "Move", "element": actor, "target": cell})])
+        if "Burn" not in [action['type'] for action in turn]:
+            raise AssertionError("%s moved onto lava without burning" % actor)
+        game.register(turn)
+        game.future.append(turn)
+        game.step_forward(announce=False)
+        if actor['id'] in state.positions or actor in state.actors or state.get(cell) is not pool:
+            raise AssertionError("%s survived lava, or the lava went with it" % actor)
+        if state.zobrist_key() != zobrist.compute(state):
+            raise AssertionError("Burning %s left the hash out of date" % actor)
+
+        game.step_backward()
+        if (layout(state), dict(state.positions), state.zobrist_key()) != before:
+            raise AssertionError("Stepping back over %s burning didn't put everything back" % actor)
+        burned += 1
+    return burned
+
+
+def legality(games=10, turns=200, seed=0):
+    """legal.validate_all and legal.legal_actions agree with building each candidate action for every actor and
+       calling its validate, at every turn of replayed games."""
+    checked = 0
+    for game in simulator.replays(games, turns, seed):
+        for state in simulator.positions(game):
+            for actor in state.actors:
+                if actor['id'] not in state.positions:
+                    continue
+                candidates = benchmark.candidates(actor)
+                expected = [action.validate(state) != False for action in candidates]
+                if legal.validate_all(state, candidates) != expected:
+                    raise AssertionError("validate_all disagrees with validate for %s on turn %s" % (actor, game.turn))
+                offered = set(kind for kind, ability in legal.CHOICES if ability in actor['abilities'])
+                valid = set((action['type'], action.target) for action, ok in zip(candidates, expected)
+                            if ok and action['type'] in offered)
+                if set(legal.legal_actions(state, actor)) != valid | set([("Null", state.find(actor))]):
+                    raise AssertionError("legal_actions disagrees with validate for %s on turn %s" % (actor, game.turn))
+                checked += 1
+    return checked
+
+
+def distributed(games=40, workers=2, max_turns=200, batch=16, seed=0):
+    """Games handed out by a coordinator to worker processes on localhost add up to the same results as playing
+       them inline."""
+    def outcomes(tally):
+        return dict((level, totals[:4]) for level, totals in tally.levels.items())
+
+    expected = cluster.Tally()
+    for result in simulator.simulate(games, seed=seed, workers=1, max_turns=max_turns).results:
+        expected.add(result)
+    tally = cluster.local(games, workers, seed=seed, max_turns=max_turns, batch=batch)[0]
+    if outcomes(tally) != outcomes(expected):
+        raise AssertionError("%d workers played different games" % workers)
+    return games
+
+
+def hashing(games=20, turns=200, seed=0):
+    """The incremental Zobrist hash, of states and of their copies, matches hashing from scratch, replaying forwards
+       action by action and backwards turn by turn.  Remembering enemy decisions in a transposition table, cold or
+       warm, changes neither the turns played nor what is drawn from the random module."""
+    def check(state, action=None):
+        if state.zobrist_key() != zobrist.compute(state):
+            raise AssertionError("Incremental hash differs from a fresh one before %s" % (action,))
+
+    checked = 0
+    for game in simulator.replays(games, turns, seed):
+        listener = lambda action: check(game.state, action)
+        game.action_listeners.add(listener)
+        game.fast_forward()
+        game.action_listeners.remove(listener)
+        check(game.state)
+        while game.past:
+            game.step_backward()
+            check(game.state)
+            check(copy.deepcopy(game.state))
+            checked += 1
+
+    table = zobrist.TranspositionTable()
+    played = {}
+    for name, transpositions in (("no table", None), ("cold table", table), ("warm table", table)):
+        for i in range(games):
+            game = simulator.new_game(1 + i % 9, seed + i)
+            game.state.transpositions = transpositions
+            simulator.run(game, simulator.wander, random.Random(seed + i), turns)
+            outcome = benchmark.summarize(game.past), random.getstate()
+            if played.setdefault(i, outcome) != outcome:
+                raise AssertionError("Level %s seed %s played differently with a %s" % (1 + i % 9, seed + i, name))
+    return checked
+
+
+def searches(positions=10, budget=0.05, seed=0):
+    """Searching, in either mode, leaves the state as it found it."""
+    for mode in ("deepening", "mcts"):
+        for i in range(positions):
+            game = simulator.new_game(1 + i % 9, seed + i)
+            before = zobrist.compute(game.state), game.state.occupancy
+            search.Search(mode, budget, rng=random.Random(seed + i))(game.state)
+            if (zobrist.compute(game.state), game.state.occupancy) != before:
+                raise AssertionError("Searching level %s seed %s changed the state" % (1 + i % 9, seed + i))
+    return 2 * positions
+
+
+def geometry(queries=2000, units=12, seed=0):
+    """Batched distances and the bitboard nearest cell agree with asking grid.distance one pair at a time."""
+    rng = random.Random(seed)
+    for i in range(queries):
+        cell, group = rng.choice(grid.VALID_CELLS), rng.sample(grid.VALID_CELLS, units)
+        pairs = [grid.distance(cell, end) for end in group]
+        if grid.distances(cell, group) != pairs or grid.nearest(cell, grid.to_mask(group)) != min(pairs):
+            raise AssertionError("Batched distances from %s disagree with distance" % (cell,))
+    return queries
+
+
+def shapes(origin=(5, 0)):
+    """Cones and polygons give the cells worked out by hand for a few fixed cases around :origin:, which needs every
+       cell within three steps of it on the board.  On the board cone_mask agrees with cone."""
+    (L, R), D = origin, grid.DIRECTIONS
+    near = set(cell for cell in grid.VALID_CELLS if 0 < grid.distance(origin, cell) <= 2)
+    off = (-1, 0)   # Just off the board, so cone works it out without the tables
+    cases = [
+        ("depth 2 cone between adjacent directions", grid.cone(origin, D[0], D[1], 2),
+         set([(L, R - 1), (L - 1, R), (L, R - 2), (L - 1, R - 1), (L - 2, R)])),
+        ("full sweep as two half cones", grid.cone(origin, D[0], D[3], 2) | grid.cone(origin, D[3], D[0], 2), near),
+        ("sweep round to the direction before", grid.cone(origin, D[0], D[5], 2), near - set([(L + 1, R - 2)])),
+        ("cone along one direction", grid.cone(origin, D[2], D[2], 3), set([(L - 1, R + 1), (L - 2, R + 2),
+                                                                            (L - 3, R + 3)])),
+        ("cone from off the board", grid.cone(off, D[4], D[5], 1), set([(0, 0), (0, -1)]) & set(grid.VALID_CELLS)),
+        ("one corner polygon", grid.cells_in_polygon(origin), set([origin])),
+        ("two corner polygon", grid.cells_in_polygon(origin, (L, R - 3)),
+         set([origin, (L, R - 1), (L, R - 2), (L, R - 3)])),
+        ("triangle of neighbors", grid.cells_in_polygon(origin, (L, R - 1), (L - 1, R)),
+         set([origin, (L, R - 1), (L - 1, R)])),
+    ]
+    if off in grid.TOPOLOGY.index or sum(1 for cell in grid.VALID_CELLS if grid.distance(origin, cell) <= 3) != 37:
+        raise AssertionError("%s is too close to the edge of the board, or %s is on it" % (origin, off))
+    for name, found, expected in cases:
+        if set(found) != expected:
+            raise AssertionError("%s gave %s, not %s" % (name, sorted(found), sorted(expected)))
+    for left in range(len(D)):
+        for right in range(len(D)):
+            cells = grid.cone(origin, D[left], D[right], 3)
+            if grid.cone_mask(origin, D[left], D[right], 3) != grid.to_mask(cells):
+                raise AssertionError("cone_mask disagrees with cone from %s to %s" % (D[left], D[right]))
+    return len(cases) + len(D) ** 2
+
+
+def sightlines(games=20, turns=200, seed=0):
+    """The ray tables find the same first thing in the way as walking out along coordinates, from every occupied
+       cell at every turn of replayed games."""
+    topology = grid.TOPOLOGY
+    rays = 0
+    for game in simulator.replays(games, turns, seed):
+        for state in simulator.positions(game):
+            cells = [cell for cell in state if cell in topology.index]
+            walked = [benchmark.walk(state, cell, direction, 4) for cell in cells for direction in grid.DIRECTIONS]
+            found = [topology.first(topology.index[cell], d, state.occupancy, 4)
+                     for cell in cells for d in range(len(grid.DIRECTIONS))]
+            if found != walked:
+                raise AssertionError("Ray tables disagree with walking on turn %s" % game.turn)
+            rays += len(found)
+    return rays
+
+
+def bombs(games=20, turns=200, seed=0):
+    """The bomb scores agree with the original scan on whether a bomber has anywhere worth bombing, and the scan's
+       cell is among the scored ones.  They needn't pick the same cell: the scan takes the first in set order, while
+       ThrowBomb now takes the scored cell with the lowest id."""
+    aimed = 0
+    for game in simulator.replays(games, turns, seed, levels=(8, 9)):    # The levels with the most Demolitionists
+        for state in simulator.positions(game):
+            for actor in benchmark.bombers(state):
+                cell = benchmark.scan(actor, state)
+                mask = abilities.ThrowBomb.score_mask(actor, state) & grid.burst_mask(state.find(actor), 3)
+                mask &= ~state.occupancy
+                if (cell is None) != (mask == 0) or cell is not None and not grid.cell_mask(cell) & mask:
+                    raise AssertionError("Bomb scores disagree with scanning on turn %s" % game.turn)
+                aimed += 1
+    return aimed
+
+
+# Turns an ability waits after firing, as it was first written: every turn it was consulted the cooldown went down
+# by one, and the ability fired only once it went below zero.
+WAITS = {"WizardsBeam": ("beam cooldown", 1), "ThrowBomb": ("bomb cooldown", 2)}
+
+
+def cadence(games=40, turns=300, seed=0):
+    """Mages and Demolitionists fire no more often than the original countdown allowed, their cooldowns always match
+       it, and no turn ticks a cooldown that is already at zero."""
+    fired = 0
+    for game in simulator.replays(games, turns, seed):
+        countdowns = {}
+        while game.future:
+            if not game.state.actors:     # Setting the level up
+                game.step_forward(announce=False)
+                continue
+            actor = game.state.actors[0]
+            before = dict((key, actor[key]) for key, _ in WAITS.values() if key in actor)
+            turn = game.future[0]
+            game.step_forward(announce=False)
+            for key, value in before.items():
+                count = countdowns.get((actor['id'], key), 0)
+                if value != max(count, 0):
+                    raise AssertionError("%s has %s %s on turn %s, not %s" % (actor, key, value, game.turn, count))
+                countdowns[actor['id'], key] = count - 1
+            for action in turn:
+                if action['type'] == "Cooldown" and before.get(action['cooldown'], 0) <= 0:
+                    raise AssertionError("%s ticked %s at zero on turn %s" % (actor, action['cooldown'], game.turn))
+            for ability in set(action['type'] for action in turn if action.element['id'] == actor['id']) & set(WAITS):
+                key, wait = WAITS[ability]
+                if countdowns[actor['id'], key] >= 0:
+                    raise AssertionError("%s used %s early on turn %s" % (actor, ability, game.turn))
+                countdowns[actor['id'], key] = wait
+                fired += 1
+    return fired
+
+
+CHECKS = {
+    "bombs": bombs,
+    "cadence": cadence,
+    "chains": chains,
+    "distributed": distributed,
+    "environments": environments,
+    "geometry": geometry,
+    "hashing": hashing,
+    "lava": lava,
+    "legal": legality,
+    "observations": observations,
+    "search": searches,
+    "seek": seeking,
+    "shapes": shapes,
+    "sightlines": sightlines,
+    "snapshots": snapshots,
+    "turns": turns,
+    "workers": workers,
+}
+
+
+# The checks that the engine records, replays and rewinds games exactly, run by --test engine.
+ENGINE = ["turns", "seek", "hashing", "observations", "cadence"]
+
+
+def run(names=None):
+    """Run the checks called :names: (all of them by default), stopping at the first that fails."""
+    for name in names or sorted(CHECKS):
+        start = timer()
+        checked = CHECKS[name]()
+        print("%-12s ok  %8d checked in %.2fs" % (name, checked, timer() - start))
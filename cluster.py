@@ -0,0 +1,274 @@
+from collections import deque
+from timeit import default_timer as timer
+import json
+import multiprocessing
+import os
+import socket
+import struct
+import threading
+import time
+
+import simulator
+import utils
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Every message is a frame: a four byte big endian length, then that many bytes of compact JSON.
+#
+#   worker -> coordinator   {"type": "hello", "name": ...}
+#                           {"type": "ready", "results": null or {"batch": id, "tally": Tally.to_json()}}
+#   coordinator -> worker   {"type": "batch", "batch": id, "jobs": [[level, seed], ...], "policy": ...,
+#                            "max_turns": ...}
+#                           {"type": "wait", "seconds": ...}
+#                           {"type": "done"}
+#
+# A worker says hello once, then sends ready (with the results of its last batch, if any) and does whatever it's told.
+HEADER = struct.Struct("!I")
+MAX_FRAME = 1 << 24
+
+
+class ConnectionClosed(utils.HopliteError):
+    pass
+
+
+def send(sock, message):
+    data = json.dumps(message, separators=(",", ":")).encode("utf-8")
+    sock.sendall(HEADER.pack(len(data)) + data)
+
+
+def read(sock, size):
+    """Read exactly :size: bytes from :sock:"""
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise ConnectionClosed()
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def receive(sock):
+    size, = HEADER.unpack(read(sock, HEADER.size))
+    if size > MAX_FRAME:
+        raise ConnectionClosed("Frame of %d bytes is too big" % size)
+    return json.loads(read(sock, size).decode("utf-8"))
+
+
+class Tally(object):
+    """Results of many games added up by level: games played, games the hero won, turns, errors and seconds spent.
+       Unlike simulator.Summary it doesn't keep the individual results, so it stays small enough to send."""
+
+    FIELDS = ("games", "won", "turns", "errors", "seconds")
+
+    def __init__(self, hero="red"):
+        self.hero = hero
+        self.levels = {}    # level -> [games, won, turns, errors, seconds]
+
+    def add(self, result):
+        totals = self.levels.setdefault(result.level, [0, 0, 0, 0, 0.0])
+        totals[0] += 1
+        totals[1] += result.winner == self.hero
+        totals[2] += result.turns
+        totals[3] += result.winner == "error"
+        totals[4] += result.seconds
+
+    def merge(self, levels):
+        """Add in the totals of another tally, as given by to_json."""
+        for level, values in levels.items():
+            totals = self.levels.setdefault(int(level), [0, 0, 0, 0, 0.0])
+            for i, value in enumerate(values):
+                totals[i] += value
+
+    def to_json(self):
+        return dict((str(level), totals) for level, totals in self.levels.items())
+
+    def total(self, field):
+        return sum(totals[self.FIELDS.index(field)] for totals in self.levels.values())
+
+    def report(self, seconds):
+        games, turns = self.total("games"), self.total("turns")
+        print("%d games, %d turns in %.2fs: %.1f games/sec, %.1f turns/sec, %d errors"
+              % (games, turns, seconds, games / seconds, turns / seconds, self.total("errors")))
+        for level, (played, won, turns, errors, spent) in sorted(self.levels.items()):
+            print("  level %2d: %6d games, %5.1f%% won" % (level, played, 100.0 * won / played))
+
+
+class Coordinator(object):
+    """Hands out seeded batches of games to workers over TCP and adds up what they send back.
+
+       Game i plays level levels[i % len(levels)] with seed :seed: + i, exactly as simulator.simulate does, and the
+       games are grouped into batches of :batch:.  Workers pull a batch whenever they're idle, so faster workers
+       play more of them.  Batches aren't split or taken away from a worker once it has started them.  Once none are
+       left to hand out, an idle worker is given a second copy of the batch that has been running longest, so the
+       last batches don't wait on one slow worker (speculative re-execution, like MapReduce's backup tasks).
+       Whichever copy finishes first counts and the other's results are thrown away.  A worker that disconnects, or
+       says nothing for :timeout: seconds, gives up its batches to the next worker that asks, and a worker can join
+       or rejoin at any time."""
+
+    def __init__(self, games, levels=None, seed=0, policy="wander", max_turns=500, batch=32, host="127.0.0.1",
+                 port=0, timeout=600):
+        levels = levels or simulator.all_levels()
+        jobs = [(levels[i % len(levels)], seed + i) for i in range(games)]
+        self.batches = [jobs[i:i + batch] for i in range(0, games, batch)]
+        self.policy = policy
+        self.max_turns = max_turns
+        self.timeout = timeout
+
+        self.lock = threading.Condition()
+        self.pending = deque(range(len(self.batches)))  # Batches nobody has been given yet
+        self.running = {}       # batch -> connections playing it
+        self.started = {}       # batch -> when it was first handed out
+        self.finished = set()
+        self.tally = Tally()
+        self.speculated = 0     # Second copies of running batches handed out
+        self.wasted = 0         # Results that arrived after another copy of the batch had finished
+        self.connections = 0
+
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((host, port))
+        self.server.listen(64)
+
+    @property
+    def address(self):
+        return self.server.getsockname()
+
+    @property
+    def complete(self):
+        return len(self.finished) == len(self.batches)
+
+    def serve(self):
+        """Accept workers until every batch is finished, then return the tally."""
+        acceptor = threading.Thread(target=self.accept)
+        acceptor.daemon = True
+        acceptor.start()
+        with self.lock:
+            while not self.complete:
+                self.lock.wait(1.0)
+        return self.tally
+
+    def accept(self):
+        while True:
+            try:
+                sock, address = self.server.accept()
+            except socket.error:
+                return
+            with self.lock:
+                self.connections += 1
+                connection = self.connections
+            handler = threading.Thread(target=self.handle, args=(sock, connection))
+            handler.daemon = True
+            handler.start()
+
+    def close(self):
+        self.server.close()
+
+    def handle(self, sock, connection):
+        """Talk to one worker until it goes away."""
+        sock.settimeout(self.timeout)
+        name = connection
+        try:
+            name = receive(sock)["name"]
+            logger.info("Worker %s joined", name)
+            while True:
+                message = receive(sock)
+                if message.get("results"):
+                    self.finish(connection, message["results"]["batch"], message["results"]["tally"])
+                send(sock, self.assign(connection))
+        except (ConnectionClosed, socket.error, ValueError, KeyError):
+            logger.info("Worker %s left", name)
+        finally:
+            self.release(connection)
+            sock.close()
+
+    def assign(self, connection):
+        """The next message for an idle worker."""
+        with self.lock:
+            if self.complete:
+                return {"type": "done"}
+            if self.pending:
+                batch = self.pending.popleft()
+            else:
+                # Nothing new is left, so run a second copy of the oldest batch still running elsewhere
+                others = [b for b, holders in self.running.items() if connection not in holders and len(holders) < 2]
+                if not others:
+                    return {"type": "wait", "seconds": 0.1}
+                batch = min(others, key=lambda b: self.started[b])
+                self.speculated += 1
+            self.running.setdefault(batch, set()).add(connection)
+            self.started.setdefault(batch, timer())
+            return {"type": "batch", "batch": batch, "jobs": self.batches[batch], "policy": self.policy,
+                    "max_turns": self.max_turns}
+
+    def finish(self, connection, batch, tally):
+        with self.lock:
+            self.running.get(batch, set()).discard(connection)
+            if batch in self.finished:
+                self.wasted += 1
+                return
+            self.finished.add(batch)
+            self.running.pop(batch, None)
+            self.tally.merge(tally)
+            self.lock.notify_all()
+
+    def release(self, connection):
+        """Put back the batches of a worker that went away, unless someone else is still playing them."""
+        with self.lock:
+            for batch, holders in list(self.running.items()):
+                holders.discard(connection)
+                if not holders:
+                    del self.running[batch]
+                    self.pending.appendleft(batch)
+
+
+def work(host, port, name=None):
+    """Worker: play batches for the coordinator at :host: and :port: until it says there are none left.  Returns the
+       number of batches played."""
+    sock = socket.create_connection((host, port))
+    played = 0
+    try:
+        send(sock, {"type": "hello", "name": name or "%s-%d" % (socket.gethostname(), os.getpid())})
+        results = None
+        while True:
+            send(sock, {"type": "ready", "results": results})
+            message = receive(sock)
+            if message["type"] == "done":
+                return played
+            if message["type"] == "wait":
+                time.sleep(message["seconds"])
+                results = None
+                continue
+
+            tally = Tally()
+            policy = simulator.load_policy(message["policy"])
+            for level, seed in message["jobs"]:
+                tally.add(simulator.play(level, seed, policy, message["max_turns"]))
+            results = {"batch": message["batch"], "tally": tally.to_json()}
+            played += 1
+    except ConnectionClosed:
+        return played
+    finally:
+        sock.close()
+
+
+def local(games, workers=None, levels=None, seed=0, policy="wander", max_turns=500, batch=32):
+    """Run a coordinator here along with :workers: worker processes (one per core by default) on localhost.
+       Returns the tally and the seconds it took."""
+    coordinator = Coordinator(games, levels, seed, policy, max_turns, batch)
+    host, port = coordinator.address
+    processes = [multiprocessing.Process(target=work, args=(host, port, "local-%d" % w))
+                 for w in range(workers or multiprocessing.cpu_count())]
+    start = timer()
+    for process in processes:
+        process.daemon = True
+        process.start()
+    try:
+        tally = coordinator.serve()
+        seconds = timer() - start
+    finally:
+        coordinator.close()
+    for process in processes:
+        process.join()
+    return tally, seconds
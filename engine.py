@@ -1,51 +1,235 @@
-import shared
-from reactions import REACTIONS
+from flowfield import FlowFields
+from planes import Planes
+from snapshot import Snapshots
+from reactions import determine_reactions
+from collections import deque
+from contextlib import contextmanager
 from shared import CreateAction
 import copy
 import json
 import utils
 import grid
 import random
+import units
+import zobrist
 
 
 import logging
 logger = logging.getLogger(__name__)
 
 
+class InconsistentState(utils.HopliteError):
+    """Raised in debug mode when the State's indexes disagree with its contents."""
+    pass
+
+
 class State(dict):
     """This State object manages the current game state.  This involves the location of every item on the map, and
        the order in which elements take their turns."""
 
-    def __init__(self):
+    debug = False   # When True, every find is cross-checked against a full scan of the grid.
+
+    def __init__(self, board=None):
+        self.board = board or grid.BOARD    # The cells everything here is worked out on, with their lookup tables
         self.actors = []    # Track the actors in a list.  We'll treat this a a queue for the purposes of turn order.
+        self.positions = {}     # Reverse index from element id to the cell it occupies
+        self.occupancy = 0      # Bitboard of every occupied cell (see Board.to_mask)
+        self.team_masks = {}    # Bitboard of the cells held by each team
+        self.version = 0        # Bumped every time the occupancy changes, so caches know when to recompute.
+        self.flow_fields = FlowFields()
+        self.snapshots = Snapshots()
+        self.planes = None      # Feature planes kept up to date as the state changes, once enabled by track_planes
+        self.zobrist = 0        # Zobrist hash of every unit where it stands, see zobrist_key
+        self.transpositions = None  # TranspositionTable enemies remember their decisions in, if any
+
+    def __deepcopy__(self, memo):
+        """Copy the units and the turn order onto a fresh State.  The position index, bitboards, version and hash
+           aren't copied: placing each unit on the copy marks it, which builds them again from scratch."""
+        result = State(self.board)
+        memo[id(self)] = result
+        for key, value in self.items():
+            result[key] = copy.deepcopy(value, memo)
+        result.actors = copy.deepcopy(self.actors, memo)
+        result.transpositions = copy.deepcopy(self.transpositions, memo)
+        if self.planes is not None:
+            result.track_planes(self.planes.hero)
+        return result
 
     def __setitem__(self, key, value):
         """Tweak this to make sure every key is a tuple of two ints."""
         key = (int(key[0]), int(key[1]))
+        self.snapshots.changing(key)
+        if key in self:
+            self._unmark(key, self[key])
         super(State, self).__setitem__(key, value)
+        self._mark(key, value)
+
+    def __delitem__(self, key):
+        self.snapshots.changing(key)
+        self._unmark(key, self[key])
+        super(State, self).__delitem__(key)
+
+    def pop(self, key, *default):
+        if key in self:
+            self.snapshots.changing(key)
+            self._unmark(key, self[key])
+        return super(State, self).pop(key, *default)
+
+    def snapshot(self):
+        """An immutable view of the state as it is now.  It costs next to nothing to take: only the turn order is
+           copied straight away, and cells only if they change afterwards."""
+        return self.snapshots.take(self)
+
+    def changing(self, unit):
+        """Units on the grid call this before they change, so snapshots can keep the old values."""
+        key = self.positions[unit['id']]
+        self.snapshots.changing(key)
+        self.zobrist ^= zobrist.unit_key(key, unit, self.board)
+
+    def changed(self, unit):
+        """Units on the grid call this after they change, so the feature planes and hash can follow."""
+        key = self.positions[unit['id']]
+        self.zobrist ^= zobrist.unit_key(key, unit, self.board)
+        if self.planes is not None:
+            self.planes.write(key, unit)
+
+    def zobrist_key(self):
+        """A 64 bit hash of the state: every unit with its type, team, health and cooldowns where it stands, and whose
+           turn it is.  Kept up to date as the state changes, so it costs next to nothing to read."""
+        return self.zobrist ^ zobrist.turn_key(self)
+
+    def track_planes(self, hero="red"):
+        """Start keeping feature planes (see planes.Planes) for the team :hero:, and return them."""
+        if self.planes is None or self.planes.hero != hero:
+            self.planes = Planes(self, hero)
+        return self.planes
+
+    @contextmanager
+    def untracked(self):
+        """Stop the feature planes following the state for the duration, for work that changes the state and puts
+           it back as it was, like working out a turn or searching: the planes would only be written twice over."""
+        planes, self.planes = self.planes, None
+        try:
+            yield
+        finally:
+            self.planes = planes
+
+    def _mark(self, key, value):
+        """Add the element at :key: to the position index, the occupancy and team bitboards and the hash."""
+        self.positions[value['id']] = key
+        value.watcher = self
+        if self.planes is not None:
+            self.planes.write(key, value)
+        self.zobrist ^= zobrist.unit_key(key, value, self.board)
+        bit = self.board.cell_mask(key)
+        self.occupancy |= bit
+        self.version += 1
+        if 'team' in value:
+            self.team_masks[value['team']] = self.team_masks.get(value['team'], 0) | bit
+
+    def _unmark(self, key, value):
+        """Remove the element at :key: from the position index, the occupancy and team bitboards and the hash."""
+        if self.positions.get(value['id']) == key:
+            del self.positions[value['id']]
+            value.watcher = None
+        if self.planes is not None:
+            self.planes.clear(key)
+        self.zobrist ^= zobrist.unit_key(key, value, self.board)
+        bit = self.board.cell_mask(key)
+        self.occupancy &= ~bit
+        self.version += 1
+        if 'team' in value:
+            self.team_masks[value['team']] &= ~bit
+
+    def ally_mask(self, team):
+        """Bitboard of the cells held by :team:"""
+        return self.team_masks.get(team, 0)
+
+    def enemy_mask(self, team):
+        """Bitboard of the cells held by any team other than :team:"""
+        results = 0
+        for other, mask in self.team_masks.items():
+            if other != team:
+                results |= mask
+        return results
 
     def find(self, target):
         """function to look up the location of an item in the state."""
+        if self.debug:
+            return self.check(target)
+        return self.positions[target['id']]
+
+    def scan(self, target):
+        """Look up the location of an item the slow way, by checking every cell."""
         for key, value in self.items():
             if value == target:
                 return key
         raise KeyError()
 
+    def check(self, target):
+        """Look up the location of an item in both the index and by scanning, and complain if they disagree."""
+        indexed = self.positions.get(target['id'])
+        try:
+            scanned = self.scan(target)
+        except KeyError:
+            scanned = None
+        if indexed != scanned:
+            raise InconsistentState("%s is indexed at %s but found at %s" % (target, indexed, scanned))
+        if scanned is None:
+            raise KeyError()
+        return scanned
+
     def __str__(self):
         """Make printing the state nicer."""
         return "Actors: %s\nGrid: %s" % (self.actors, super(State, self).__str__())
 
 
+class Checkpoint(object):
+    """A saved copy of where everything was at the end of a turn.  The units themselves aren't copied, only their
+       fields, because the recorded actions refer to the unit objects and must keep doing so after a restore."""
+
+    def __init__(self, state, units):
+        """Save :state: and the fields of every unit in :units:, which maps unit ids to the unit and its fields before
+           it was placed.  Units that have already died are saved too, so stepping back past their death after a
+           restore brings them back as they were when they died."""
+        self.cells = dict(state)
+        self.actors = list(state.actors)
+        self.fields = dict((uid, dict(unit)) for uid, (unit, initial) in units.items())
+
+    def restore(self, state, units):
+        """Put :state: back the way it was.  :units: is the same map of units as the checkpoint was taken with, and
+           units that weren't known yet when it was taken are put back to their fields before they were placed."""
+        for key in list(state.keys()):
+            del state[key]
+        for uid, (unit, initial) in units.items():
+            dict.clear(unit)
+            dict.update(unit, self.fields.get(uid, initial))
+        for key, unit in self.cells.items():
+            state[key] = unit
+        state.actors[:] = self.actors
+
+
 class Engine(object):
     """An engine object manages the progression of the game.  It tracks turns and turn order, and determines reactions
        to actions taken."""
 
-    def __init__(self, history):
-        """Every engine has to have a starting state, which for simplicity is a history to replay."""
-        self.past = []          # All the previous turns
-        self.future = history   # All actions recorded but not played back against the stte
-        self.state = State()    # The current state of the game
+    def __init__(self, history, checkpoint_interval=32, max_checkpoints=256, board=None):
+        """Every engine has to have a starting state, which for simplicity is a history to replay, on :board: (the
+           game's own board by default).
+           Every :checkpoint_interval: turns the state is saved so seek can jump straight to it.  Once more than
+           :max_checkpoints: are held, every other one is dropped and the interval doubles."""
+        self.past = deque()             # All the previous turns
+        self.future = deque(history)    # All actions recorded but not played back against the stte
+        self.state = State(board)       # The current state of the game
         self.listeners = set()  # listeners are functions that want to know about actions during the play of the game.
+        self.action_listeners = set()  # action listeners only want the actions, not the state they happened in.
+
+        self.checkpoint_interval = checkpoint_interval
+        self.max_checkpoints = max_checkpoints
+        self.units = {}                                 # Unit id -> (unit, fields before it was placed)
+        self.checkpoints = {0: Checkpoint(self.state, self.units)}  # Turn number -> the state after that many turns
+        for turn in self.future:
+            self.register(turn)
 
     @property
     def complete(self):
@@ -62,16 +246,56 @@ class Engine(object):
     def current_actor(self):
         return self.state.actors[0]
 
+    @property
+    def turn(self):
+        """The number of turns played so far"""
+        return len(self.past)
+
     def fast_forward(self):
         """Execute any remaining future items"""
-        while self.future != []:
+        while self.future:
             self.step_forward()
 
     def rewind(self):
         """Rewind all past turns"""
-        while self.past != []:
+        while self.past:
             self.step_backward()
 
+    def seek(self, turn):
+        """Jump to the state after :turn: turns have been played, by restoring the last checkpoint at or before it and
+           replaying at most checkpoint_interval turns.  Listeners aren't told about the replayed turns."""
+        turn = max(0, min(turn, len(self.past) + len(self.future)))
+        checkpoint = max(index for index in self.checkpoints if index <= turn)
+
+        if turn < self.turn or checkpoint > self.turn:     # Restore the checkpoint unless it's quicker not to
+            while self.turn > checkpoint:
+                self.future.appendleft(self.past.pop())
+            while self.turn < checkpoint:
+                self.past.append(self.future.popleft())
+            self.checkpoints[checkpoint].restore(self.state, self.units)
+
+        while self.turn < turn:
+            self.step_forward(announce=False)
+
+    def register(self, turn):
+        """Note every unit :turn: brings into the game, with its fields as they are before it's placed."""
+        for action in turn:
+            for value in list(action.values()) + list(action.__getstate__().values()):
+                if isinstance(value, units.Unit) and value['id'] not in self.units:
+                    self.units[value['id']] = (value, dict(value))
+
+    def checkpoint(self):
+        """Save the current state if a checkpoint is due, thinning out old checkpoints to stay within budget."""
+        if self.turn % self.checkpoint_interval != 0 or self.turn in self.checkpoints:
+            return
+        self.checkpoints[self.turn] = Checkpoint(self.state, self.units)
+
+        if len(self.checkpoints) > self.max_checkpoints:
+            self.checkpoint_interval *= 2
+            for index in list(self.checkpoints):
+                if index % self.checkpoint_interval != 0:
+                    del self.checkpoints[index]
+
     def step_backward(self):
         """Reverse one turn from the past against the current state"""
 
@@ -79,75 +303,89 @@ class Engine(object):
             return
 
         turn = self.past.pop()                  # Get the previous turn
-        if len(self.state.actors) > 0:          # If there's more than one actor make
-            actor = self.state.actors.pop()     # sure to keep track of turn order.
-            self.state.actors.insert(0, actor)  #
-
         for action in reversed(turn):   # For every action (and reaction) in the turn
             action.rollback(self.state)  # Undo them in reverse order
 
-        self.future.insert(0, turn)  # Add this turn to the future in case we want to redo it.
+        if len(self.state.actors) > 0:          # If there's more than one actor make
+            actor = self.state.actors.pop()     # sure to keep track of turn order.  This undoes step_forward exactly,
+            self.state.actors.insert(0, actor)  # as the actions rolled back put back any actors they removed.
 
-    def step_forward(self):
+        self.future.appendleft(turn)  # Add this turn to the future in case we want to redo it.
+
+    def step_forward(self, announce=True):
         """Playback one turn from the future against the current state"""
 
         if len(self.future) == 0:  # There are no future turns, so don't do anything.
             return
 
-        turn = self.future.pop(0)               # Get the next turn
+        turn = self.future.popleft()            # Get the next turn
         if len(self.state.actors) > 0:          # If there's more than one actor make
             actor = self.state.actors.pop(0)    # sure to keep track of turn order.
             self.state.actors.append(actor)     #
 
         for action in turn:                 # For every action (and reaction) in the turn
-            self.emit(self.state, action)   # Announce them, and the current state.
+            if announce:
+                self.emit(self.state, action)   # Announce them, and the current state.
             action.execute(self.state)      # execute the action against the current state
 
         self.past.append(turn)  # Add this turn to the past in case we want to undo it.
+        self.checkpoint()
 
     def emit(self, state, action):
         """Announce to any interested listeners each action and the state before the action"""
-        state = copy.deepcopy(state)    # Copy the state so that progressing the game doesn't screw up event listeners
-        for listener in self.listeners:  # who delay parsing the (state, action) messages.
-            listener(state, action)
+        for listener in self.action_listeners:
+            listener(action)
+
+        if self.listeners:
+            state = state.snapshot()        # Snapshot the state so that progressing the game doesn't screw up event
+            for listener in self.listeners:  # listeners who delay parsing the (state, action) messages.
+                listener(state, action)
 
     def record(self, overwrite=False):
         """Record new actions for the game"""
 
-        if overwrite == False and self.future != []:  # Sometimes we may not want to be able to record new actions.
+        if overwrite == False and self.future:  # Sometimes we may not want to be able to record new actions.
             raise utils.HopliteError("Cannot record a turn when future turns exist unless the overwrite flag is True")
 
-        actor = self.state.actors[0]            # Get the current actor, and ask them for their action, given the state
-        # Heroes may raise a NeedsInput Exception here for the UI to respond to.
-        actions = actor.get_action(self.state)
+        with self.state.untracked():
+            actor = self.state.actors[0]        # Get the current actor, and ask them for their action, given the state
+            # Heroes may raise a NeedsInput Exception here for the UI to respond to.
+            actions = actor.get_action(self.state) or []
 
-        # Copy the state, because determining reactions requires us to modify the current state (in case a reaction
-        # causes a future reaction).  So we copy the state, and then apply them to our main state later.
-        state = copy.deepcopy(self.state)
-
-        turn = []
-        while len(actions) != 0:  # While we have an action left in the turn
-            action = actions.pop(0)
-            logger.debug(action)
-            reactions = determine_reactions(action, state)  # Determine the reaction that action triggers
-            actions = reactions + actions   # Insert them immediately after the action that triggers them.
-            action.execute(state)      # Modify the current state by executing the action
-            turn.append(action)             # Add it to the turn.
+            turn = self.resolve(actions)
 
         # Once we've generated the full turn, add it to the future, and then just fast forward, so we can reuse our
         # code for applying and announcing actions.
+        self.register(turn)
         self.future.append(turn)
         self.fast_forward()
 
-
-def determine_reactions(action, state):
-    """For our game, certain actions can cause reactions that should happen during the same turn.
-       For example, Moving past an enemy may trigger a slash Action."""
-
-    reactions = []              # make a list of all reactions triggered by the action,
-    for behavior in REACTIONS:  # by iterating through the reactions and asking them
-        reactions.extend(behavior(action, state))
-    return reactions
+    def resolve(self, actions):
+        """Work out the full turn, reactions included, that :actions: cause.
+           Determining reactions requires us to modify the current state (in case a reaction causes a future
+           reaction), so each action is executed against the live state and the whole turn is rolled back once it is
+           known, leaving the state as it was."""
+        turn = []
+        try:
+            play(actions, self.state, turn)
+        finally:
+            for action in reversed(turn):
+                action.rollback(self.state)
+        return turn
+
+
+def play(actions, state, turn):
+    """Execute :actions: against :state:, each one followed straight away by the reactions it triggers (and theirs,
+       and so on), appending everything executed to :turn:.  The actions waiting to be played are kept in a deque,
+       so long chains of reactions, like a blast killing many units, don't copy the queue for each one."""
+    queue = deque(actions)
+    while queue:   # While we have an action left in the turn
+        action = queue.popleft()
+        logger.debug(action)
+        queue.extendleft(reversed(determine_reactions(action, state)))  # Its reactions go immediately after it.
+        action.execute(state)       # Modify the current state by executing the action
+        turn.append(action)         # Add it to the turn.
+    return turn
 
 
 def load_level(filename):
@@ -163,29 +401,32 @@ def load_level(filename):
     return result
 
 
-def generate_level(number):
+def generate_level(number, rng=random, board=None):
+    """The opening turn of level :number:, with the enemies placed using :rng: on :board: (the game's own board by
+       default)."""
     with open(utils.data_file('levels.json'), 'r') as f:
         data = json.load(f)
         level = data[str(number)]
 
+    board = board or grid.BOARD
     results = []
-    remaining_cells = copy.copy(grid.VALID_CELLS)
+    remaining_cells = copy.copy(board.cells)
 
     # Add a hero
     results.append(CreateAction({
         "type": "Spawn",
-        "target": [10, 0],
+        "target": list(board.start),
         "element": {
                 "type": "Hero",
                 "team": "red"
         }
     }))
-    remaining_cells.remove((10, 0))
+    remaining_cells.remove(board.start)
 
     # Add the enemies
     for kind, count in level.items():
         for i in range(0, count):
-            location = random.choice(remaining_cells)
+            location = rng.choice(remaining_cells)
             results.append(CreateAction({
                 "type": "Spawn",
                 "target": location,
@@ -0,0 +1,167 @@
+from timeit import default_timer as timer
+import ctypes
+import multiprocessing
+import random
+
+import grid
+import planes
+import simulator
+import utils
+import vecenv
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Commands the parent leaves in the shared command slot before waking the workers.
+STEP, RESET, CLOSE = range(3)
+
+POLL = 1.0  # Seconds between checks that the workers are still alive while waiting on them
+
+
+class WorkerError(utils.HopliteError):
+    pass
+
+
+class SharedBuffers(object):
+    """Everything the parent and the workers exchange, in memory shared between the processes.  The parent writes
+       the command and actions; each worker writes the observations, rewards, done flags, invalid action flags and
+       action masks of its own slice of games."""
+
+    def __init__(self, count):
+        self.count = count
+        self.stride = len(planes.PLANES) * grid.TOPOLOGY.size
+        self.command = multiprocessing.RawValue(ctypes.c_byte, STEP)
+        self.failed = multiprocessing.RawValue(ctypes.c_byte, 0)
+        self.actions = multiprocessing.RawArray(ctypes.c_byte, count)
+        self.observations = multiprocessing.RawArray(ctypes.c_ubyte, count * self.stride)
+        self.rewards = multiprocessing.RawArray(ctypes.c_double, count)
+        self.dones = multiprocessing.RawArray(ctypes.c_byte, count)
+        self.invalid = multiprocessing.RawArray(ctypes.c_byte, count)
+        self.masks = multiprocessing.RawArray(ctypes.c_byte, count * len(vecenv.ACTIONS))
+
+    def slice(self, first, count):
+        """A writable view of the observations of games :first: to :first: + :count: - 1, for a VecEnv to write
+           into directly."""
+        view = memoryview(self.observations)
+        if hasattr(view, "cast"):
+            view = view.cast("B")   # The same bytes, in the format the feature planes are copied from
+        return view[first * self.stride:(first + count) * self.stride]
+
+    def publish(self, env, first, infos=None):
+        """Copy the results of :env:, which plays games :first: onwards, into the buffers.  Its observations are
+           already there: the env writes them straight into the slice it was given."""
+        last = first + env.count
+        self.rewards[first:last] = env.rewards
+        self.dones[first:last] = env.dones
+        self.invalid[first:last] = [int(info["invalid"]) for info in infos] if infos else [0] * env.count
+        self.masks[first * len(vecenv.ACTIONS):last * len(vecenv.ACTIONS)] = env.action_masks()
+
+
+def serve(buffers, first, count, levels, seed, stride, max_turns, go, ready):
+    """Worker process: play games :first: to :first: + :count: - 1 of the pool on a VecEnv of its own, doing whatever
+       the command slot says each time :go: is released and releasing :ready: once the buffers are written."""
+    random.seed(seed)   # Enemies break ties with the random module, which would otherwise differ from run to run.
+    env = vecenv.VecEnv(count, levels, seed, max_turns, stride=stride, observations=buffers.slice(first, count))
+    while True:
+        go.acquire()
+        command = buffers.command.value
+        if command == CLOSE:
+            return
+        try:
+            if command == RESET:
+                env.reset()
+                buffers.publish(env, first)
+            else:
+                infos = env.step(buffers.actions[first:first + count])[3]
+                buffers.publish(env, first, infos)
+        except Exception:
+            logger.exception("Worker for games %s-%s failed", first, first + count - 1)
+            buffers.failed.value = 1
+        ready.release()
+
+
+class EnvPool(object):
+    """:count: games split between :workers: processes (one per core by default), with the same interface as VecEnv.
+
+       Each worker owns a contiguous slice of the games and writes its results straight into shared memory, so the
+       only things that cross between processes are the action indices and a semaphore per worker in each
+       direction.  The shared buffers are made with multiprocessing.RawArray, which works on every Python the game
+       supports; multiprocessing.shared_memory would need Python 3.8.  Worker w seeds its games with :seed: + w,
+       :seed: + w + workers and so on, so no two games share a seed.
+
+       A command that takes the workers longer than :timeout: seconds, or a worker that dies, raises WorkerError
+       rather than leaving the caller waiting forever.  So does a command that raises in a worker, once; the workers
+       carry on, and the pool can be used again, typically after a reset."""
+
+    def __init__(self, count, levels=None, seed=0, max_turns=500, workers=None, timeout=60.0):
+        levels = levels or simulator.all_levels()
+        workers = max(1, min(workers or multiprocessing.cpu_count(), count))
+        self.count = count
+        self.timeout = timeout
+        self.buffers = SharedBuffers(count)
+        self.ready = multiprocessing.Semaphore(0)
+        self.gates = []
+        self.processes = []
+        for w in range(workers):
+            first, last = count * w // workers, count * (w + 1) // workers
+            go = multiprocessing.Semaphore(0)
+            process = multiprocessing.Process(target=serve, args=(self.buffers, first, last - first, levels,
+                                                                  seed + w, workers, max_turns, go, self.ready))
+            process.daemon = True
+            process.start()
+            self.gates.append(go)
+            self.processes.append(process)
+
+    @property
+    def shape(self):
+        """Shape of the observations: games, planes, cells."""
+        return (self.count, len(planes.PLANES), grid.TOPOLOGY.size)
+
+    def command(self, command):
+        """Have every worker carry out :command:, and wait until they all have."""
+        self.buffers.command.value = command
+        for go in self.gates:
+            go.release()
+        deadline = timer() + self.timeout
+        for go in self.gates:
+            self.wait(deadline)
+        if self.buffers.failed.value:
+            self.buffers.failed.value = 0   # Reported once; the next command starts with a clean slate
+            raise WorkerError("A worker failed, see the log for details")
+
+    def wait(self, deadline):
+        """Wait for one worker to report it is ready, checking every POLL seconds that they are all still running."""
+        while not self.ready.acquire(True, min(POLL, max(deadline - timer(), 0))):
+            dead = [process for process in self.processes if not process.is_alive()]
+            if dead:
+                raise WorkerError("Worker %s exited with code %s" % (dead[0].pid, dead[0].exitcode))
+            if timer() >= deadline:
+                raise WorkerError("The workers took longer than %ss" % self.timeout)
+
+    def reset(self):
+        """Start a new game in every slot and return the observations."""
+        self.command(RESET)
+        return memoryview(self.buffers.observations)
+
+    def step(self, actions):
+        """Play the hero action with index :actions:[g] in every game g, as VecEnv.step does.  Returns views of the
+           shared (observations, rewards, dones, invalid action flags), which the next step overwrites."""
+        self.buffers.actions[:] = list(actions)
+        self.command(STEP)
+        return (memoryview(self.buffers.observations), self.buffers.rewards, self.buffers.dones,
+                self.buffers.invalid)
+
+    def action_masks(self):
+        """For each game and each of vecenv.ACTIONS, 1 if the hero may take it now."""
+        return self.buffers.masks
+
+    def close(self):
+        """Stop the workers, terminating any that don't stop within the timeout."""
+        self.buffers.command.value = CLOSE
+        for go in self.gates:
+            go.release()
+        for process in self.processes:
+            process.join(self.timeout)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
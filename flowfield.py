@@ -0,0 +1,54 @@
+import random
+
+import grid
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class FlowFields(object):
+    """Cache of distance fields for one State.  Units of the same type on the same team want to reach the same cells,
+       so rather than each of them searching for a path, one breadth first search is run outwards from each distinct
+       goal bitboard and every unit reads its next step off the result.  The cache is thrown away whenever the
+       occupancy version of the state changes."""
+
+    def __init__(self):
+        self.version = None
+        self.fields = {}
+
+    def __deepcopy__(self, memo):
+        """A copy of the state starts with an empty cache; the fields are cheap to rebuild and not part of the game."""
+        return FlowFields()
+
+    def get(self, state, goals):
+        """Steps from every cell to the nearest unoccupied cell in the bitboard :goals:, avoiding occupied cells."""
+        if self.version != state.version:
+            self.version = state.version
+            self.fields.clear()
+
+        goals &= ~state.occupancy
+        if goals not in self.fields:
+            self.fields[goals] = state.board.distance_field(state.board.ids(goals), state.occupancy)
+        return self.fields[goals]
+
+
+def next_step(state, cell, goals, rng=random):
+    """The cell to move to from :cell: to get closer to the bitboard :goals:.  Returns :cell: itself if it is already
+       a goal, and raises NoPathExistsError if no goal can be reached.  Ties are broken using :rng:."""
+    board = state.board
+    if board.cell_mask(cell) & goals:
+        return cell
+
+    field = state.flow_fields.get(state, goals)
+    best, choices = None, []
+    for j in board.neighbors[board.index[cell]]:
+        if field[j] is None:
+            continue
+        if best is None or field[j] < best:
+            best, choices = field[j], [j]
+        elif field[j] == best:
+            choices.append(j)
+
+    if best is None:
+        raise grid.NoPathExistsError()
+    return board.cells[rng.choice(choices)]
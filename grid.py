@@ -1,7 +1,9 @@
 from __future__ import division
-from Queue import PriorityQueue
+from heapq import heappop, heappush
 from utils import HopliteError
+from topology import Board
 
+import math
 import random
 
 import logging
@@ -19,20 +21,21 @@ class NotFoundError(HopliteError):
 
 DIRECTIONS = [(0, -1), (-1, 0), (-1, 1), (0, 1), (1, 0), (1, -1)]
 
-VALID_CELLS = [(0, 0), (0, 1), (0, 2), (0, 3), (0, 4), (1, -1), (1, 0), (1, 1), (1, 2), (1, 3), (1, 4), (2, -2),
-               (2, -1), (2, 0), (2, 1), (2, 2), (2, 3), (2, 4), (3, -3), (3, -2), (3, -1), (3, 0), (3, 1), (3, 2),
-               (3, 3), (3, 4), (4, -4), (4, -3), (4, -2), (4, -1), (4, 0), (4, 1), (4, 2), (4, 3), (4, 4), (5, -4),
-               (5, -3), (5, -2), (5, -1), (5, 0), (5, 1), (5, 2), (5, 3), (5, 4), (6, -4),
-               (6, -3), (6, -2), (6, -1), (6, 0), (6, 1), (6, 2), (6, 3), (6, 4), (7, -4), (7, -3), (7, -2), (7, -1),
-               (7, 0), (7, 1), (7, 2), (7, 3), (7, 4), (8, -4), (8, -3), (8, -2), (8, -1), (8, 0), (8, 1), (8, 2),
-               (8, 3), (9, -4), (9, -3), (9, -2), (9, -1), (9, 0), (9, 1), (9, 2), (10, -4), (10, -3), (10, -2),
-               (10, -1), (10, 0), (10, 1), (11, -4), (11, -3), (11, -2), (11, -1), (11, 0)]
+# The board the game is played on, with its lookup tables built once at import time.  Everything that isn't handed a
+# board of its own (see State.board) uses this one.
+BOARD = Board(DIRECTIONS)
+TOPOLOGY = BOARD
+VALID_CELLS = BOARD.cells
 
 
 def arc(origin, direction, depth):
     """A set of cells extending from three neighbors of the start cell."""
-    results = set()
     index = DIRECTIONS.index(direction)
+    if origin in TOPOLOGY.index:
+        rays = TOPOLOGY.rays[TOPOLOGY.index[origin]]
+        return set(TOPOLOGY.cells[j] for d in range(index - 1, index + 2) for j in rays[d % 6][:depth])
+
+    results = set()
     for i in range(1, depth+1):
         for j in range(index - 1, index + 2):
             angle = DIRECTIONS[j % 6]
@@ -46,20 +49,34 @@ def arc(origin, direction, depth):
 
 def burst(cell, distance=1):
     """The set of cells within :distance: distance of :cell:"""
-    results = set((cell,))
+    if cell in TOPOLOGY.index:
+        return TOPOLOGY.burst(TOPOLOGY.index[cell], distance)
+
+    results = frozenset((cell,))
     for i in range(0, distance):
-        results = reduce(lambda r, cell: r | neighbors(cell), results, results)
+        results = results.union(*[neighbors(c) for c in results])
     return results
 
 
 def cells_in_polygon(*corners):
     """Given a set of corners, determine all the cells partially or completely enclosed within that polygon"""
-    raise NotImplementedError
+    return to_cells(polygon_mask(*corners))
 
 
 def cone(origin, left, right, depth):
     """Set of cells extending depth from origin bounded by left and right as viewed from origin"""
-    raise NotImplementedError
+    if origin in TOPOLOGY.index:
+        return to_cells(cone_mask(origin, left, right, depth))
+
+    first, last = DIRECTIONS.index(left), DIRECTIONS.index(right)
+    if first == last:
+        return set(line(origin, left, depth)) - set((origin,))
+    results = set()
+    for d in range(first, first + (last - first) % 6):
+        (uL, uR), (vL, vR) = DIRECTIONS[d % 6], DIRECTIONS[(d + 1) % 6]
+        results.update((origin[0] + a * uL + b * vL, origin[1] + a * uR + b * vR)
+                       for a in range(depth + 1) for b in range(depth + 1 - a) if a + b)
+    return set(filter(isValid, results))
 
 
 def diagonals(cell):
@@ -71,9 +88,28 @@ def diagonals(cell):
 
 def distance(start, end):
     """Minimum number of cells crossed to get from :start: to :end:"""
+    index = TOPOLOGY.index
+    if start in index and end in index:
+        return TOPOLOGY.distances[index[start]][index[end]]
+
     a = to_cubic(start)
     b = to_cubic(end)
-    return (abs(a[0] - b[0]) + abs(a[1] - b[1]) + abs(a[2] - b[2])) / 2
+    return (abs(a[0] - b[0]) + abs(a[1] - b[1]) + abs(a[2] - b[2])) // 2
+
+
+def distances(start, ends):
+    """[distance(:start:, end) for end in :ends:], reading a row of the table once when :start: is on the board"""
+    index = TOPOLOGY.index
+    if start not in index:
+        return [distance(start, end) for end in ends]
+    row = TOPOLOGY.distances[index[start]]
+    return [row[index[end]] if end in index else distance(start, end) for end in ends]
+
+
+def distance_matrix(starts, ends):
+    """The distance from each of :starts: to each of :ends:, as a list of rows"""
+    ends = list(ends)
+    return [distances(start, ends) for start in starts]
 
 
 def find(grid, obj):
@@ -84,63 +120,81 @@ def find(grid, obj):
     raise NotFoundError
 
 
-def find_path(grid, start, goals):
-    """Find the shortest possible path across :grid: from :start: to a cell in :goals:"""
-    if not isinstance(list(goals)[0], tuple):
+def find_path(grid, start, goals, rng=random):
+    """Find the shortest possible path across :grid: from :start: to a cell in :goals:.  Occupied cells can't be
+       passed through.  Ties between equally short paths are broken using :rng:, so units don't all favour the same
+       routes, while a seeded rng still gives reproducible paths.  A State is searched on its own board."""
+    if isinstance(goals, tuple) and len(goals) != 0 and not isinstance(goals[0], tuple):
         goals = [goals]
-    frontier = PriorityQueue()
-    frontier.put((0, [start]))
-
-    cost_so_far = {start: 0}
-
-    while not frontier.empty():
-        cost, path = frontier.get()
-        current = path[-1]
-
-        if current in goals:
+    if start in goals:
+        return [start]
+
+    board = getattr(grid, 'board', BOARD)
+    index = board.index
+    targets = set(index[goal] for goal in goals if goal in index)
+    heuristic = board.distance_field(targets)   # Steps to the nearest goal, ignoring anything in the way.
+    blocked = grid.occupancy if hasattr(grid, 'occupancy') else board.to_mask(grid)
+
+    source = index[start]
+    if heuristic[source] is None:
+        raise NoPathExistsError()
+
+    cost_so_far = {source: 0}
+    came_from = {source: None}
+    frontier = [(heuristic[source], rng.random(), source)]
+
+    while frontier:
+        priority, _, current = heappop(frontier)
+        if priority > cost_so_far[current] + heuristic[current]:  # A cheaper route here was already expanded.
+            continue
+
+        if current in targets:
+            path = []
+            while current is not None:
+                path.append(board.cells[current])
+                current = came_from[current]
+            path.reverse()
             return path
 
-        for next in sorted(neighbors(current), key=lambda k: random.random()):
-            new_cost = cost + float("inf") if next in grid else 1
-            if new_cost < cost_so_far.get(next, float("inf")):
+        new_cost = cost_so_far[current] + 1
+        for next in board.neighbors[current]:
+            if board.bits[next] & blocked:
+                continue
+            if new_cost < cost_so_far.get(next, new_cost + 1):
                 cost_so_far[next] = new_cost
-                priority = new_cost + \
-                    min(map(lambda x: distance(next, x), goals))
-                frontier.put((priority, path + [next]))
+                came_from[next] = current
+                heappush(frontier, (new_cost + heuristic[next], rng.random(), next))
     raise NoPathExistsError()
 
 
 def isValid(cell):
     """Determine if a cell is on the standard sized grid I'm using."""
-    L, R = cell
-    if abs(R) <= 4 and \
-            0 <= R + L <= 11 and \
-            0 <= L <= 11:
-        return True
-    return False
+    return cell in TOPOLOGY.index
 
 
 def line(cell, direction, distance=1):
-    results = set()
+    if cell in TOPOLOGY.index and direction in DIRECTIONS:
+        return TOPOLOGY.line(TOPOLOGY.index[cell], DIRECTIONS.index(direction), distance)
+
     L, R = cell
     dL, dR = direction
-    for d in range(0, distance + 1):
-        if isValid((L + dL * d, R + dR * d)):
-            results.add((L + dL * d, R + dR * d))
-    return results
+    return frozenset(filter(isValid, [(L + dL * d, R + dR * d) for d in range(0, distance + 1)]))
 
 
 def lines(cell, distance=1):
-    results = set()
-    for direction in DIRECTIONS:
-        results = results | line(cell, direction, distance)
-    return results
+    if cell in TOPOLOGY.index:
+        return TOPOLOGY.lines(TOPOLOGY.index[cell], distance)
+
+    return frozenset().union(*[line(cell, direction, distance) for direction in DIRECTIONS])
 
 
 def neighbors(cell):
     """Determine the valid cells that are next to the cell provided."""
+    if cell in TOPOLOGY.index:
+        return TOPOLOGY.neighbor_cells[TOPOLOGY.index[cell]]
+
     cL, cR = cell
-    return set(filter(isValid, [(cL + oL, cR + oR) for (oL, oR) in DIRECTIONS]))
+    return frozenset(filter(isValid, [(cL + oL, cR + oR) for (oL, oR) in DIRECTIONS]))
 
 
 def to_cubic(cell):
@@ -163,3 +217,131 @@ def add(start, vector):
 
 def mult(vector, scalar):
     return (vector[0] * scalar, vector[1] * scalar)
+
+
+# Bitboard versions of the queries above.  A bitboard is an int with bit i set for every cell whose TOPOLOGY id is i,
+# so combining areas is a matter of &, | and & ~ instead of building and merging sets of tuples.
+
+def to_mask(cells):
+    """The bitboard holding every valid cell in :cells:"""
+    return TOPOLOGY.to_mask(cells)
+
+
+def to_cells(mask):
+    """The set of cells held in the bitboard :mask:"""
+    return TOPOLOGY.to_cells(mask)
+
+
+def iter_mask(mask):
+    """Yield the cells held in the bitboard :mask:"""
+    return TOPOLOGY.iter_mask(mask)
+
+
+def cell_mask(cell):
+    return TOPOLOGY.cell_mask(cell)
+
+
+def neighbor_mask(cell):
+    return TOPOLOGY.neighbor_masks[TOPOLOGY.index[cell]]
+
+
+def burst_mask(cell, distance=1):
+    return TOPOLOGY.burst_mask(TOPOLOGY.index[cell], distance)
+
+
+def ring_mask(cell, distance=1):
+    return TOPOLOGY.ring_mask(TOPOLOGY.index[cell], distance)
+
+
+def arc_mask(origin, direction, depth):
+    return TOPOLOGY.arc_mask(TOPOLOGY.index[origin], DIRECTIONS.index(direction), depth)
+
+
+def ray_mask(cell, direction, distance=1):
+    return TOPOLOGY.ray_mask(TOPOLOGY.index[cell], DIRECTIONS.index(direction), distance)
+
+
+def lines_mask(cell, distance=1):
+    return TOPOLOGY.lines_mask(TOPOLOGY.index[cell], distance)
+
+
+def nearest(cell, mask):
+    """The distance from :cell: to the nearest cell in the bitboard :mask:, or None if it's empty"""
+    return TOPOLOGY.nearest(TOPOLOGY.index[cell], mask)
+
+
+def cone_mask(origin, left, right, depth):
+    """The cells up to :depth: steps from :origin: between the directions :left: and :right:, sweeping from :left:
+       through the directions that follow it in DIRECTIONS.  When they're the same, the cone is the single ray."""
+    i, first, last = TOPOLOGY.index[origin], DIRECTIONS.index(left), DIRECTIONS.index(right)
+    if first == last:
+        return TOPOLOGY.ray_mask(i, first, depth)
+    result = 0
+    for d in range(first, first + (last - first) % 6):
+        result |= TOPOLOGY.sector_mask(i, d % 6, depth)
+    return result
+
+
+# Geometry for polygons: cells are taken to be pointy topped hexagons with sides of length one, laid out on the plane
+# with the center of (L, R) at (sqrt(3) * (L + R / 2), 1.5 * R).
+SQRT3 = math.sqrt(3)
+CORNERS = [(math.cos(math.radians(30 + 60 * k)), math.sin(math.radians(30 + 60 * k))) for k in range(6)]
+EPSILON = 1e-9
+
+
+def center(cell):
+    L, R = cell
+    return (SQRT3 * (L + R / 2), 1.5 * R)
+
+
+CENTERS = [center(cell) for cell in TOPOLOGY.cells]
+
+
+def polygon_mask(*corners):
+    """The bitboard of the cells the polygon through the centers of the cells :corners: covers at all, even by a
+       sliver.  A cell on the polygon's boundary counts, so one corner gives that cell and two give a line of cells."""
+    points = [center(corner) for corner in corners]
+    edges = list(zip(points, points[1:] + points[:1]))
+    left, right = min(x for x, y in points) - 1, max(x for x, y in points) + 1
+    bottom, top = min(y for x, y in points) - 1, max(y for x, y in points) + 1
+
+    result = 0
+    for i, (x, y) in enumerate(CENTERS):
+        if not (left <= x <= right and bottom <= y <= top):
+            continue
+        hexagon = [(x + dx, y + dy) for dx, dy in CORNERS]
+        sides = list(zip(hexagon, hexagon[1:] + hexagon[:1]))
+        if (_inside((x, y), points, edges, True) or
+                any(_inside(corner, points, edges, False) for corner in hexagon) or
+                any(_inside(point, hexagon, sides, False) for point in points) or
+                any(_crosses(a, b, c, d) for a, b in edges for c, d in sides)):
+            result |= TOPOLOGY.bits[i]
+    return result
+
+
+def _side(a, b, p):
+    """Positive if :p: is to the left of the line from :a: to :b:, negative if it's to the right, 0 if it's on it."""
+    cross = (b[0] - a[0]) * (p[1] - a[1]) - (b[1] - a[1]) * (p[0] - a[0])
+    return 0 if abs(cross) <= EPSILON else cross
+
+
+def _on_segment(p, a, b):
+    return (_side(a, b, p) == 0 and min(a[0], b[0]) - EPSILON <= p[0] <= max(a[0], b[0]) + EPSILON and
+            min(a[1], b[1]) - EPSILON <= p[1] <= max(a[1], b[1]) + EPSILON)
+
+
+def _inside(p, points, edges, boundary):
+    """Whether :p: is inside the polygon through :points:, or :boundary: if it's on one of its :edges:"""
+    if any(_on_segment(p, a, b) for a, b in edges):
+        return boundary
+    x, y = p
+    inside = False
+    for (ax, ay), (bx, by) in edges:
+        if (ay > y) != (by > y) and x < ax + (y - ay) * (bx - ax) / (by - ay):
+            inside = not inside
+    return inside
+
+
+def _crosses(a, b, c, d):
+    """Whether the segments :a: :b: and :c: :d: cross at a point inside both."""
+    return _side(a, b, c) * _side(a, b, d) < 0 and _side(c, d, a) * _side(c, d, b) < 0
@@ -0,0 +1,89 @@
+import abilities
+
+import logging
+logger = logging.getLogger(__name__)
+
+# The actions a unit can choose as its turn, and the ability that offers each one.  Every unit may wait.  The other
+# actions (cooldowns, spawns, bombs, beams, explosions and the reactions) are either played by the engine itself or
+# accept any target, so there is nothing to enumerate.
+CHOICES = [("Move", "Move"), ("Jump", "Jump"), ("Stab", "Stab"), ("Shoot", "Shoot")]
+
+MOVE = abilities.FLAGS["Move"]
+
+
+def move_mask(state, actor, src):
+    if not actor.flags & MOVE:
+        return 0
+    return state.board.neighbor_masks[src] & ~state.occupancy
+
+
+def jump_mask(state, actor, src):
+    if not actor.flags & MOVE:     # Jump.validate asks for Move, not Jump
+        return 0
+    # Jump.validate measures two away as the crow flies, which on a convex board is the ring two steps out.
+    return state.board.ring_mask(src, 2) & ~state.occupancy
+
+
+def stab_mask(state, actor, src):
+    return state.board.neighbor_masks[src] & state.enemy_mask(actor['team'])
+
+
+def shoot_mask(state, actor, src):
+    """The first thing in each direction, if it's an enemy two to four steps away."""
+    topology = state.board
+    results = 0
+    for d in range(len(topology.directions)):
+        steps = topology.first(src, d, state.occupancy, 4)
+        if steps > 1:
+            results |= topology.bits[topology.rays[src][d][steps - 1]]
+    return results & state.enemy_mask(actor['team'])
+
+
+# Bitboards of the targets that pass each action's validate, given the actor's cell id.
+MASKS = {
+    "Move": move_mask,
+    "Jump": jump_mask,
+    "Stab": stab_mask,
+    "Shoot": shoot_mask,
+}
+
+
+def legal_mask(state, actor, kind):
+    """Bitboard of the targets for which an action of type :kind: by :actor: passes validate"""
+    return MASKS[kind](state, actor, state.board.index[state.find(actor)])
+
+
+def legal_actions(state, actor):
+    """Yield every (action type, target) :actor: may choose as its turn: waiting where it stands, then the actions
+       its abilities offer (see CHOICES), lowest cell id first.  Each one passes its action's validate."""
+    src = state.find(actor)
+    yield ("Null", src)
+    i = state.board.index[src]
+    for kind, ability in CHOICES:
+        if actor.flags & abilities.FLAGS[ability] and (kind not in ("Stab", "Shoot") or 'team' in actor):
+            for target in state.board.iter_mask(MASKS[kind](state, actor, i)):
+                yield (kind, target)
+
+
+def validate_all(state, actions):
+    """[action.validate(state) != False for action in :actions:], checked together.  Each actor is found once, and
+       the legal targets of each actor and action type are worked out once and shared by every candidate that asks
+       about them.  Action types without a mask in MASKS are left to their own validate."""
+    index, bits, positions = state.board.index, state.board.bits, state.positions
+    masks = {}
+    results = []
+    for action in actions:
+        kind, actor = action['type'], action['element']
+        if kind == "Null":
+            results.append(True)
+            continue
+        key = (actor['id'], kind)
+        mask = masks.get(key)
+        if mask is None:
+            if kind not in MASKS or key[0] not in positions or (kind in ("Stab", "Shoot") and 'team' not in actor):
+                results.append(action.validate(state) != False)
+                continue
+            mask = masks[key] = MASKS[kind](state, actor, index[positions[key[0]]])
+        target = action['target']
+        results.append(target in index and bits[index[target]] & mask != 0)
+    return results
@@ -0,0 +1,118 @@
+import units
+
+import logging
+logger = logging.getLogger(__name__)
+
+UNIT_TYPES = sorted(units.INITIAL_DATA)     # A unit's type code is its index here plus one; zero is an empty cell.
+TYPE_CODES = dict((kind, code + 1) for code, kind in enumerate(UNIT_TYPES))
+COOLDOWNS = ["beam cooldown", "bomb cooldown"]
+
+# Feature planes, each holding one byte per cell id.  The type planes are one-hot, with the plane for type code c at
+# index c.  Teams are 0 for none, 1 for the hero's team and 2 for any other.  The threat plane marks every cell an
+# enemy of the hero threatens (see Unit.threat_mask).
+PLANES = ["occupied"] + ["type " + kind for kind in UNIT_TYPES] + ["team", "health"] + COOLDOWNS + ["threat"]
+TEAM_PLANE = PLANES.index("team")
+HEALTH_PLANE = PLANES.index("health")
+COOLDOWN_PLANES = [PLANES.index(key) for key in COOLDOWNS]
+THREAT_PLANE = PLANES.index("threat")
+
+
+def team_code(unit, hero):
+    if 'team' not in unit:
+        return 0
+    return 1 if unit['team'] == hero else 2
+
+
+def threat_mask(state, hero):
+    """Bitboard of the cells threatened by the enemies of the team :hero:"""
+    results = 0
+    for cell in state.board.iter_mask(state.enemy_mask(hero)):
+        results |= state[cell].threat_mask(state)
+    return results
+
+
+def encode(state, hero="red"):
+    """The feature planes of :state:, worked out from scratch by walking every cell of the board."""
+    board = state.board
+    cells = board.size
+    planes = bytearray(len(PLANES) * cells)
+    for i, cell in enumerate(board.cells):
+        unit = state.get(cell)
+        if unit is None:
+            continue
+        planes[i] = 1
+        planes[i + cells * TYPE_CODES[unit['type']]] = 1
+        planes[i + cells * TEAM_PLANE] = team_code(unit, hero)
+        planes[i + cells * HEALTH_PLANE] = max(unit.get('health', 0), 0)
+        for key, plane in zip(COOLDOWNS, COOLDOWN_PLANES):
+            planes[i + cells * plane] = max(unit.get(key, 0), 0)
+
+    threats = threat_mask(state, hero)
+    for i in range(cells):
+        if board.bits[i] & threats:
+            planes[i + cells * THREAT_PLANE] = 1
+    return planes
+
+
+class Planes(object):
+    """The feature planes of one State, kept up to date as it changes rather than encoded again every turn.
+
+       The state writes a cell whenever an element is placed in it or removed from it, and units on the grid tell it
+       after each change to their fields, so every Action.execute and rollback is reflected as it happens.  The threat
+       plane depends on where every enemy stands, so it is brought up to date when the planes are read and the
+       occupancy version has moved on.  Reading gives a memoryview of the buffer, which copies nothing."""
+
+    def __init__(self, state, hero="red"):
+        self.state = state
+        self.hero = hero
+        self.board = state.board
+        self.cells = self.board.size
+        self.buffer = bytearray(len(PLANES) * self.cells)
+        self.threats = 0        # Bitboard of the cells written to the threat plane
+        self.version = None     # Occupancy version the threat plane was written at
+        for key, unit in state.items():
+            self.write(key, unit)
+
+    def clear(self, key):
+        """Empty the cell :key:"""
+        i = self.board.index.get(key)
+        if i is None:
+            return
+        for plane in range(THREAT_PLANE):
+            self.buffer[i + self.cells * plane] = 0
+
+    def write(self, key, unit):
+        """Write :unit: into the cell :key:"""
+        i = self.board.index.get(key)
+        if i is None:
+            return
+        self.clear(key)
+        cells, buffer = self.cells, self.buffer
+        buffer[i] = 1
+        buffer[i + cells * TYPE_CODES[unit['type']]] = 1
+        buffer[i + cells * TEAM_PLANE] = team_code(unit, self.hero)
+        buffer[i + cells * HEALTH_PLANE] = max(unit.get('health', 0), 0)
+        for name, plane in zip(COOLDOWNS, COOLDOWN_PLANES):
+            buffer[i + cells * plane] = max(unit.get(name, 0), 0)
+
+    def refresh(self):
+        """Bring the threat plane up to date, rewriting only the cells whose threat changed."""
+        if self.version == self.state.version:
+            return
+        self.version = self.state.version
+        threats = threat_mask(self.state, self.hero)
+        offset = self.cells * THREAT_PLANE
+        for i in self.board.ids(threats ^ self.threats):
+            self.buffer[offset + i] = 1 if self.board.bits[i] & threats else 0
+        self.threats = threats
+
+    def view(self):
+        """A read only memoryview of every plane, laid out plane by plane as in PLANES."""
+        self.refresh()
+        view = memoryview(self.buffer)
+        return view.toreadonly() if hasattr(view, "toreadonly") else view
+
+    def plane(self, name):
+        """A memoryview of the plane called :name:"""
+        index = PLANES.index(name)
+        return self.view()[index * self.cells:(index + 1) * self.cells]
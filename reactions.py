@@ -1,29 +1,73 @@
-import actions
+from collections import namedtuple
+
+import abilities
 from shared import CreateAction
 import grid
 
 import logging
 logger = logging.getLogger(__name__)
 
+HEALTH, BURN = (abilities.FLAGS[name] for name in ("Health", "Burn"))
 
-def slash(action, state):
-    """The Slash action is triggered if a character able to slash steps past an enemy"""
+# A reaction rule: :react: is called with (action, state) for every action whose class is, or inherits from, one of
+# :types: (action class names), if the acting element has every ability in the :flags: bitflags.  It returns the list
+# of reactions triggered.
+Rule = namedtuple("Rule", ["react", "types", "flags"])
 
-    # Check to make sure the actor is Moving and that they can slash
-    if not isinstance(action, actions.Move) or "Slash" not in action['element']['abilities']:
-        return []
+REACTIONS = []  # Every rule, in the order their reactions are played
+
+
+class Dispatch(dict):
+    """The rules that apply to each action class, worked out the first time an action of the class turns up."""
+
+    def __missing__(self, klass):
+        names = set(base.__name__ for base in klass.__mro__)
+        rules = self[klass] = tuple(rule for rule in REACTIONS if names.intersection(rule.types))
+        return rules
 
+
+DISPATCH = Dispatch()
+
+
+def reacts_to(*types, **kwargs):
+    """Decorator registering a reaction rule for actions of :types:, optionally only by elements with every ability
+       named in :abilities:"""
+    flags = 0
+    for name in kwargs.get('abilities', ()):
+        flags |= abilities.FLAGS[name]
+
+    def register(react):
+        REACTIONS.append(Rule(react, types, flags))
+        DISPATCH.clear()
+        return react
+    return register
+
+
+def determine_reactions(action, state):
+    """The reactions :action: triggers, from every rule that applies, in the order the rules were registered."""
+    results = []
+    for rule in DISPATCH[type(action)]:
+        if rule.flags and rule.flags & action['element'].flags != rule.flags:
+            continue
+        results.extend(rule.react(action, state))
+    return results
+
+
+@reacts_to("Move", abilities=["Slash"])
+def slash(action, state):
+    """The Slash action is triggered if a character able to slash steps past an enemy"""
     actor = action['element']
     src = state.find(actor)
     dest = action['target']
     # Can only target cells that were next to the actor at the start and end of his movement.
     # By doing it this way, we can handle leaping with the same test.
-    targets = grid.neighbors(src) & grid.neighbors(dest)
+    board = state.board
+    targets = board.neighbor_cells[board.index[src]] & board.neighbor_cells[board.index[dest]]
 
     results = []
     for target in targets:
         # for every cell in targets, check if an enemy is present
-        if target in state and actor['team'] != state[target]['team'] and "Health" in state[target]['abilities']:
+        if target in state and actor['team'] != state[target].get('team') and state[target].flags & HEALTH:
             # If so, add a Slash Action as a reaction.
             reaction = CreateAction({
                 "type": "Slash",
@@ -36,25 +80,21 @@ def slash(action, state):
     return results
 
 
+@reacts_to("Move", abilities=["Lunge"])
 def lunge(action, state):
     """The Slash action is triggered if a character able to slash steps past an enemy"""
-
-    # Check to make sure the actor is Moving and that they can slash
-    if not isinstance(action, actions.Move) or "Lunge" not in action['element']['abilities']:
-        return []
-
     actor = action['element']
     src = state.find(actor)
     dest = action['target']
 
     # confirm this is a move in a direction we can lunge.
     vector = grid.unit_vector(src, dest)
-    if vector not in grid.DIRECTIONS:
+    if vector not in state.board.directions:
         return []
 
     # Determine the target
     target = grid.add(dest, vector)
-    if target in state and actor['team'] != state[target]['team'] and "Health" in state[target]['abilities']:
+    if target in state and actor['team'] != state[target].get('team') and state[target].flags & HEALTH:
         # If so, add a Slash Action as a reaction.
         reaction = CreateAction({
             "type": "Lunge",
@@ -66,20 +106,16 @@ def lunge(action, state):
     return []
 
 
+@reacts_to("Attack")
 def die(action, state):
     """Dying is a reaction to being attacked."""
-
-    # We're using inheritance here to make checking if we were attacked simpler.
-    if not isinstance(action, actions.Attack):
-        return []
-
     if action.target not in state:  # If the attack misses, ignore it.
         return []
 
     element = state[action.target]
 
     # Make sure the attack brings our health below 0
-    if "Health" in element['abilities'] and (element["health"] - action.damage) <= 0:
+    if element.flags & HEALTH and (element["health"] - action.damage) <= 0:
         # If so, add a Die action as a reaction
         reaction = CreateAction({
             "type": "Die",
@@ -91,5 +127,18 @@ def die(action, state):
     return []
 
 
-# Expose these as an list.
-REACTIONS = [slash, lunge, die]
+@reacts_to("Move")
+def burn(action, state):
+    """Anything forced onto lava (ordinary moves can't end on an occupied cell) burns up, and the lava stays."""
+    lava = state.get(action.target)
+    if lava is None or not lava.flags & BURN:
+        return []
+
+    reaction = CreateAction({
+        "type": "Burn",
+        "element": action['element'],
+        "target": action.target,
+        "lava": lava
+    })
+    logger.debug("%s triggered %s", action, reaction)
+    return [reaction]
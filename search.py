@@ -0,0 +1,250 @@
+from collections import namedtuple
+from timeit import default_timer as timer
+import math
+import random
+
+import engine
+import legal
+import planes
+import shared
+import zobrist
+
+import logging
+logger = logging.getLogger(__name__)
+
+WIN = 1000.0
+LOSS = -1000.0
+SEARCH_KEY = 0x5EA5C4  # Mixed into state hashes so search values never collide with other users of a shared table
+
+# What a search found: the hero's best action, its value, the deepest depth (or number of MCTS iterations) finished,
+# the hero turns simulated and the seconds spent.
+Result = namedtuple("Result", ["action", "value", "depth", "nodes", "seconds"])
+
+
+def nodes_per_second(result):
+    return result.nodes / result.seconds if result.seconds else 0.0
+
+
+def hero_actions(state, hero):
+    """Every action the hero can take: wait, step to an empty neighbor, or jump to an empty cell two away.  Slashes,
+       lunges and other reactions follow from these by themselves."""
+    return [shared.CreateAction({"type": kind, "element": hero, "target": target})
+            for kind, target in legal.legal_actions(state, hero)]
+
+
+def play_turn(state, actions):
+    """Play one turn against :state: the way the engine replays it: the actor goes to the back of the queue, then
+       :actions: and every reaction they trigger are executed.  Returns the turn, for undo_turn."""
+    state.actors.append(state.actors.pop(0))
+    return engine.play(actions, state, [])
+
+
+def undo_turn(state, turn):
+    """Exactly reverse play_turn."""
+    for action in reversed(turn):
+        action.rollback(state)
+    state.actors.insert(0, state.actors.pop())
+
+
+def alive(state, hero):
+    return hero['id'] in state.positions
+
+
+class Search(object):
+    """Finds the hero's best action by playing turns out against the live state with execute and rollback.  The
+       enemies move with their real abilities and the reactions are worked out by the real rules, and everything is
+       undone before the search returns.
+
+       Two modes are offered.  "deepening" searches every hero action to depth 1, 2, ... hero turns (each followed
+       by all the enemies' turns), keeping the answer of the deepest search that finished within :budget: seconds.
+       "mcts" runs Monte Carlo tree search with UCT, finishing each playout with :rollout: random hero turns.
+       Values found are remembered in :table:, a zobrist.TranspositionTable that can be shared."""
+
+    def __init__(self, mode="deepening", budget=0.5, table=None, max_depth=6, rollout=3, exploration=1.4,
+                 rng=None):
+        if mode not in ("deepening", "mcts"):
+            raise ValueError("Unknown search mode %s" % mode)
+        self.mode = mode
+        self.budget = budget
+        self.table = table if table is not None else zobrist.TranspositionTable()
+        self.max_depth = max_depth
+        self.rollout = rollout
+        self.exploration = exploration
+        self.rng = rng or random.Random()
+        self.nodes = 0
+        self.deadline = None
+
+    def __call__(self, state):
+        """Search from :state:, where it is the hero's turn.  Returns a Result."""
+        hero = state.actors[0]
+        self.nodes = 0
+        self.deadline = timer() + self.budget
+        self.table.new_generation()
+        start = timer()
+
+        with state.untracked():
+            if self.mode == "mcts":
+                action, value, depth = self.mcts(state, hero)
+            else:
+                action, value, depth = self.deepening(state, hero)
+        return Result(action, value, depth, self.nodes, timer() - start)
+
+    @property
+    def expired(self):
+        return timer() >= self.deadline
+
+    def evaluate(self, state, hero):
+        """How good :state: is for the hero: alive, healthy, with few enemies left and none threatening its cell."""
+        if not alive(state, hero):
+            return LOSS
+        enemies = state.enemy_mask(hero['team'])
+        if not enemies:
+            return WIN
+        board = state.board
+        i = board.index[state.find(hero)]
+        threatened = 1 if planes.threat_mask(state, hero['team']) & board.bits[i] else 0
+        return 100.0 * hero['health'] - 20.0 * bin(enemies).count("1") - 30.0 * threatened - board.nearest(i, enemies)
+
+    def advance(self, state, hero, action):
+        """Play the hero's :action:, then every other actor's turn until the hero's comes round again or the game is
+           decided.  Returns the turns played, for retreat."""
+        self.nodes += 1
+        turns = [play_turn(state, [action])]
+        for i in range(len(state.actors)):
+            if state.actors[0]['id'] == hero['id'] or not alive(state, hero) or not state.enemy_mask(hero['team']):
+                break
+            turns.append(play_turn(state, state.actors[0].get_action(state) or []))
+        return turns
+
+    def retreat(self, state, turns):
+        for turn in reversed(turns):
+            undo_turn(state, turn)
+
+    def over(self, state, hero):
+        return not alive(state, hero) or not state.enemy_mask(hero['team'])
+
+    # Iterative deepening
+
+    def deepening(self, state, hero):
+        actions = hero_actions(state, hero)
+        best, value, finished = actions[0], None, 0
+        for depth in range(1, self.max_depth + 1):
+            try:
+                scored = [(self.value(state, hero, action, depth), i) for i, action in enumerate(actions)]
+            except Timeout:
+                break
+            scored.sort(key=lambda pair: -pair[0])
+            actions = [actions[i] for score, i in scored]   # Search the best first next time round
+            best, value, finished = actions[0], scored[0][0], depth
+            if value in (WIN, LOSS):
+                break
+        return best, value, finished
+
+    def value(self, state, hero, action, depth):
+        """The value of the hero taking :action:, looking :depth: hero turns ahead."""
+        if self.expired:
+            raise Timeout()
+        turns = self.advance(state, hero, action)
+        try:
+            if depth == 1 or self.over(state, hero):
+                return self.evaluate(state, hero)
+            key = state.zobrist_key() ^ SEARCH_KEY
+            remembered = self.table.lookup(key, depth - 1, None)
+            if remembered is not None:
+                return remembered
+            result = max(self.value(state, hero, follow, depth - 1) for follow in hero_actions(state, hero))
+            self.table.store(key, result, depth - 1)
+            return result
+        finally:
+            self.retreat(state, turns)
+
+    # Monte Carlo tree search
+
+    def mcts(self, state, hero):
+        root = Node()
+        iterations = 0
+        while not self.expired:
+            self.playout(state, hero, root)
+            iterations += 1
+        actions = hero_actions(state, hero)
+        tried = [action for action in actions if Node.key(action) in root.children]
+        if not tried:
+            return actions[0], None, 0
+        best = max(tried, key=lambda action: root.children[Node.key(action)].visits)
+        child = root.children[Node.key(best)]
+        return best, child.total / child.visits, iterations
+
+    def playout(self, state, hero, node):
+        """One MCTS iteration from :node:, returning the score in [0, 1] it backs up.
+           The enemies break ties at random, so the same hero actions don't always lead to the same state.  The tree
+           is therefore open loop: nodes stand for sequences of hero actions, and the actions on offer are worked out
+           afresh from the state each playout reaches."""
+        action = node.select(hero_actions(state, hero), self.exploration, self.rng)
+        turns = self.advance(state, hero, action)
+        try:
+            child = node.children.get(Node.key(action))
+            if child is None:
+                node.children[Node.key(action)] = child = Node()
+                score = self.rollout_score(state, hero)
+            elif self.over(state, hero):
+                score = self.score(state, hero)
+            else:
+                score = self.playout(state, hero, child)
+            child.visits += 1
+            child.total += score
+            node.visits += 1
+            return score
+        finally:
+            self.retreat(state, turns)
+
+    def rollout_score(self, state, hero):
+        """Play up to :rollout: random hero turns, score where they lead, and undo them."""
+        played = []
+        try:
+            for i in range(self.rollout):
+                if self.over(state, hero):
+                    break
+                played.append(self.advance(state, hero, self.rng.choice(hero_actions(state, hero))))
+            return self.score(state, hero)
+        finally:
+            for turns in reversed(played):
+                self.retreat(state, turns)
+
+    def score(self, state, hero):
+        """evaluate squashed into [0, 1]"""
+        return 1.0 / (1.0 + math.exp(-self.evaluate(state, hero) / 100.0))
+
+
+class Timeout(Exception):
+    """Raised inside a depth limited search when the budget runs out."""
+    pass
+
+
+class Node(object):
+    """A point in the MCTS tree, reached by a sequence of hero actions, with the children tried from it so far."""
+
+    def __init__(self):
+        self.children = {}  # Node.key of an action -> Node
+        self.visits = 0
+        self.total = 0.0
+
+    @staticmethod
+    def key(action):
+        return (action['type'], tuple(action.target))
+
+    def select(self, actions, exploration, rng):
+        """Which of :actions: to try next: an untried one if any are left, otherwise the best by UCT."""
+        untried = [action for action in actions if self.key(action) not in self.children]
+        if untried:
+            return rng.choice(untried)
+        log = math.log(self.visits)
+
+        def uct(action):
+            child = self.children[self.key(action)]
+            return child.total / child.visits + exploration * math.sqrt(log / child.visits)
+        return max(actions, key=uct)
+
+
+def policy(game, rng, budget=0.05):
+    """Simulator hero policy: play the action an iterative deepening search picks."""
+    return Search(budget=budget, rng=rng)(game.state).action
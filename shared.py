@@ -1,3 +1,4 @@
+import importlib
 import utils
 import json
 
@@ -6,27 +7,41 @@ class InvalidAction(utils.HopliteError):
     pass
 
 
+class InvalidUnit(utils.HopliteError):
+    pass
+
+
+# The module whose classes fill each registry.  It is imported the first time the registry is needed, so these
+# factories work whichever modules the caller happened to import first.
+REGISTERING = {
+    "actions": "actions",
+    "units": "units",
+}
+
+
+def registered(registry):
+    """The classes filed under :registry: by utils.Registry, by name, importing the module that files them if no one
+       has yet."""
+    classes = utils.Registry.classes.get(registry)
+    if classes is None:
+        importlib.import_module(REGISTERING[registry])
+        classes = utils.Registry.classes.get(registry, {})
+    return classes
+
+
 def CreateAction(action):
     """Function used to create a Action object from a json dictionary"""
-    # Import this here to avoid cyclical dependencies....
-    # TODO: Fix these dependencies.
-    from actions import Action
-
-    for klass in utils.all_subclasses(Action):
-        if action['type'] == klass.__name__:
-            action['target'] = tuple(action['target'])
-            return klass(**action)
-    raise InvalidAction("%s is not a valid move." % json.dumps(action, indent=2))
+    klass = registered("actions").get(action['type'])
+    if klass is None:
+        raise InvalidAction("%s is not a valid move." % json.dumps(action, indent=2))
+    action['target'] = tuple(action['target'])
+    return klass(**action)
 
 
 def CreateUnit(**kwargs):
     """Function used to create a Unit object from a json dictionary"""
-    # Import this here to avoid cyclical dependencies....
-    # TODO: Fix these dependencies.
-    from units import Hero, Unit
-
-    # Special case for Heroes, who need to use a subclass that doesn't check abilities for actions
-    if kwargs.get('type', None) == "Hero":
-        return Hero(**kwargs)
-    else:
-        return Unit(**kwargs)
+    # Heroes use a subclass that doesn't check abilities for actions; every other type is a plain Unit.
+    klass = registered("units").get(kwargs.get('type', None), utils.Registry.roots.get("units"))
+    if klass is None:
+        raise InvalidUnit("%s is not a valid unit." % json.dumps(kwargs, indent=2))
+    return klass(**kwargs)
@@ -0,0 +1,175 @@
+from collections import namedtuple
+from timeit import default_timer as timer
+import importlib
+import json
+import multiprocessing
+import random
+
+import engine
+import search
+import shared
+import units
+import utils
+
+import logging
+logger = logging.getLogger(__name__)
+
+# The outcome of one game.  winner is the remaining team, None if the game ran out of turns, or "error".
+Result = namedtuple("Result", ["level", "seed", "winner", "turns", "seconds"])
+
+
+def wander(game, rng):
+    """Hero policy: step to a random empty neighboring cell."""
+    hero = game.current_actor
+    src = game.state.find(hero)
+    board = game.state.board
+    free = sorted(cell for cell in board.neighbor_cells[board.index[src]] if cell not in game.state)
+    target = rng.choice(free) if free else src
+    return shared.CreateAction({"type": "Move" if free else "Null", "element": hero, "target": target})
+
+
+def hold(game, rng):
+    """Hero policy: never move."""
+    hero = game.current_actor
+    return shared.CreateAction({"type": "Null", "element": hero, "target": game.state.find(hero)})
+
+
+POLICIES = {
+    "wander": wander,
+    "hold": hold,
+    "search": search.policy,
+}
+
+
+def load_policy(name):
+    """Find a hero policy, either by its name in POLICIES or as 'module:function'.  Policies are called with the
+       engine and a random number generator, and return the hero's next action."""
+    if name in POLICIES:
+        return POLICIES[name]
+    module, _, function = name.partition(":")
+    return getattr(importlib.import_module(module), function)
+
+
+def all_levels():
+    """The numbers of every level in levels.json"""
+    with open(utils.data_file('levels.json'), 'r') as f:
+        return sorted(int(number) for number in json.load(f))
+
+
+def new_game(level, seed, kind=engine.Engine, board=None):
+    """Set up :level: so that it plays out the same way every time for a given :seed:, on :board: (the game's own by
+       default).  The random module is seeded and unit ids start again from zero, so a game never depends on what
+       this process played before it."""
+    random.seed(seed)
+    units.Unit.counters.clear()
+    game = kind(engine.generate_level(level, board=board), board=board)
+    game.fast_forward()
+    return game
+
+
+def run(game, policy, rng=random, max_turns=500):
+    """Play :game: until one team remains or :max_turns: turns have been recorded, asking :policy: for the hero's
+       actions.  Returns the seconds spent."""
+    start = timer()
+    while not game.complete and game.turn < max_turns:
+        try:
+            game.record()
+        except units.RequiresInput:
+            game.current_actor.set_next_action(policy(game, rng))
+    return timer() - start
+
+
+def play(level, seed, policy=wander, max_turns=500):
+    """Play one seeded game of :level: without any UI."""
+    game = new_game(level, seed)
+    try:
+        seconds = run(game, policy, random, max_turns)
+    except Exception:
+        logger.exception("Level %s seed %s failed", level, seed)
+        return Result(level, seed, "error", game.turn, 0.0)
+    winner = list(game.remaining_teams)[0] if game.complete else None
+    return Result(level, seed, winner, game.turn, seconds)
+
+
+def replays(games, turns, seed=0, levels=None):
+    """Record :games: seeded games for up to :turns: turns each with the hero wandering, and yield each one rewound
+       to its start, ready to be stepped through again.  Game i plays level levels[i % len(levels)] (levels 1 to 9 by
+       default) with seed :seed: + i."""
+    levels = list(levels or range(1, 10))
+    for i in range(games):
+        game = new_game(levels[i % len(levels)], seed + i)
+        run(game, wander, random, turns)
+        game.seek(0)
+        yield game
+
+
+def positions(game):
+    """Step :game: through the turns it has recorded, yielding its state before each of them and at the end."""
+    while True:
+        yield game.state
+        if not game.future:
+            return
+        game.step_forward(announce=False)
+
+
+def play_job(job):
+    """Pool entry point: play one (level, seed, policy name, max_turns) job."""
+    level, seed, policy, max_turns = job
+    return play(level, seed, load_policy(policy), max_turns)
+
+
+class Summary(object):
+    """Aggregate results of a batch of games."""
+
+    def __init__(self, results, seconds, hero="red"):
+        self.results = list(results)
+        self.seconds = seconds
+        self.hero = hero
+
+    @property
+    def games(self):
+        return len(self.results)
+
+    @property
+    def turns(self):
+        return sum(result.turns for result in self.results)
+
+    @property
+    def errors(self):
+        return sum(1 for result in self.results if result.winner == "error")
+
+    def win_rates(self):
+        """Level number -> (games played, fraction won by the hero)"""
+        rates = {}
+        for level in sorted(set(result.level for result in self.results)):
+            played = [result for result in self.results if result.level == level]
+            won = sum(1 for result in played if result.winner == self.hero)
+            rates[level] = (len(played), float(won) / len(played))
+        return rates
+
+    def report(self):
+        print("%d games, %d turns in %.2fs: %.1f games/sec, %.1f turns/sec, %d errors"
+              % (self.games, self.turns, self.seconds, self.games / self.seconds, self.turns / self.seconds,
+                 self.errors))
+        for level, (played, rate) in sorted(self.win_rates().items()):
+            print("  level %2d: %6d games, %5.1f%% won" % (level, played, 100 * rate))
+
+
+def simulate(games, levels=None, seed=0, policy="wander", workers=None, max_turns=500, chunksize=16):
+    """Play :games: seeded games spread over :levels: (all of them by default) on a pool of :workers: processes
+       (one per core by default).  Game i plays level levels[i % len(levels)] with seed :seed: + i, so results don't
+       depend on which worker ran which game.  :policy: names the hero policy, see load_policy."""
+    levels = levels or all_levels()
+    jobs = [(levels[i % len(levels)], seed + i, policy, max_turns) for i in range(games)]
+
+    start = timer()
+    if workers == 1:
+        results = [play_job(job) for job in jobs]
+    else:
+        pool = multiprocessing.Pool(workers)
+        try:
+            results = list(pool.imap_unordered(play_job, jobs, chunksize))
+        finally:
+            pool.close()
+            pool.join()
+    return Summary(results, timer() - start)
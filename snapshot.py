@@ -0,0 +1,114 @@
+try:
+    from collections.abc import Mapping
+except ImportError:     # Python 2
+    from collections import Mapping
+import weakref
+
+
+class FrozenError(TypeError):
+    pass
+
+
+class FrozenUnit(dict):
+    """A read only copy of a Unit, as it was when a Snapshot was taken."""
+
+    def _frozen(self, *args, **kwargs):
+        raise FrozenError("Snapshots can't be modified")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _frozen
+
+    def __repr__(self):
+        return "<" + self['id'] + ">"
+
+    def __eq__(self, other):
+        """Like Units, frozen units are equal if their IDs are equal"""
+        return self['id'] == other['id']
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+
+# Marks a cell that was empty when the snapshot was taken.
+EMPTY = object()
+
+
+class Snapshot(Mapping):
+    """An immutable view of a State at the moment it was taken.
+
+       Taking a snapshot only copies the turn order, freezing each unit in it.  The cells are read through to the
+       live state, and the state tells its snapshots before any cell or unit on the board changes so they can keep a
+       frozen copy of the old entry.  Entries are also frozen the first time they are read, so handing out a value
+       never exposes later changes."""
+
+    def __init__(self, state):
+        self.state = state
+        self.board = state.board
+        self.actors = tuple(FrozenUnit(actor) for actor in state.actors)
+        self.entries = {}   # cell -> FrozenUnit or EMPTY, for every cell that changed or was read since the snapshot
+
+    def preserve(self, key):
+        """Freeze the entry at :key: before the live state changes it."""
+        if key not in self.entries:
+            value = dict.get(self.state, key, EMPTY)
+            self.entries[key] = EMPTY if value is EMPTY else FrozenUnit(value)
+
+    def __getitem__(self, key):
+        self.preserve(key)
+        if self.entries[key] is EMPTY:
+            raise KeyError(key)
+        return self.entries[key]
+
+    def __iter__(self):
+        for key in self.state:
+            if self.entries.get(key) is not EMPTY:
+                yield key
+        for key, value in self.entries.items():
+            if value is not EMPTY and key not in self.state:
+                yield key
+
+    def __len__(self):
+        return sum(1 for key in self)
+
+    def find(self, target):
+        """Look up the location of an item when the snapshot was taken."""
+        key = self.state.positions.get(target['id'])
+        if key is not None and key not in self.entries:   # Unchanged since the snapshot
+            return key
+        for key, value in self.items():
+            if value == target:
+                return key
+        raise KeyError()
+
+    def __str__(self):
+        return "Actors: %s\nGrid: %s" % (list(self.actors), dict(self.items()))
+
+
+class Snapshots(object):
+    """The snapshots still alive for one State.  Only weak references are kept, so a snapshot nobody holds on to
+       stops costing anything."""
+
+    def __init__(self):
+        self.refs = []
+
+    def __deepcopy__(self, memo):
+        """A copy of the state has no snapshots of its own."""
+        return Snapshots()
+
+    def take(self, state):
+        snapshot = Snapshot(state)
+        self.refs.append(weakref.ref(snapshot))
+        return snapshot
+
+    def changing(self, key):
+        """Called by the State before the cell :key:, or the unit in it, changes."""
+        if not self.refs:
+            return
+        alive = []
+        for ref in self.refs:
+            snapshot = ref()
+            if snapshot is not None:
+                snapshot.preserve(key)
+                alive.append(ref)
+        self.refs = alive
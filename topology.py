@@ -0,0 +1,346 @@
+from collections import deque
+
+
+class Rows(object):
+    """A table with a row per cell id, each built by :build: the first time it's asked for."""
+
+    def __init__(self, size, build):
+        self.rows = [None] * size
+        self.build = build
+
+    def __getitem__(self, i):
+        row = self.rows[i]
+        if row is None:
+            row = self.rows[i] = self.build(i)
+        return row
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        for i in range(len(self.rows)):
+            yield self[i]
+
+
+class Rings(object):
+    """rings[k] holds the ids reachable from :source: in exactly k steps, as found by a breadth first search that only
+       goes as far out as has been asked for."""
+
+    def __init__(self, neighbors, source):
+        self.neighbors = neighbors
+        self.rings = [(source,)]
+        self.seen = set((source,))
+        self.done = False
+
+    def reach(self, k):
+        """Search out to :k: steps, or the edge of the board if that's nearer."""
+        rings, seen, neighbors = self.rings, self.seen, self.neighbors
+        while len(rings) <= k and not self.done:
+            ring = []
+            for i in rings[-1]:
+                for j in neighbors[i]:
+                    if j not in seen:
+                        seen.add(j)
+                        ring.append(j)
+            if ring:
+                rings.append(tuple(ring))
+            else:
+                self.done, self.seen = True, None
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            self.reach(float("inf") if k.stop is None else k.stop - 1)
+            return tuple(self.rings[k])
+        self.reach(k)
+        return self.rings[k]
+
+    def __len__(self):
+        self.reach(float("inf"))
+        return len(self.rings)
+
+
+class Topology(object):
+    """Lookup tables for a hex board.  Every cell is given a dense integer id (its position in :cells:), and the
+       geometry the game asks for over and over (neighbors, distances, rings, bursts and lines) is worked out once,
+       up front or the first time it's needed, so that later queries are just table lookups."""
+
+    def __init__(self, cells, directions, radius=5):
+        self.cells = list(cells)                # id -> cell
+        self.directions = list(directions)
+        self.index = dict((cell, i) for i, cell in enumerate(self.cells))    # cell -> id
+        self.size = len(self.cells)
+
+        # steps[i][d] is the id of the cell one step from i in direction d, or None if that is off the board.
+        self.steps = []
+        for cell in self.cells:
+            self.steps.append(tuple(self.index.get((cell[0] + dL, cell[1] + dR)) for dL, dR in self.directions))
+
+        self.neighbors = [tuple(j for j in step if j is not None) for step in self.steps]
+        self.neighbor_cells = [frozenset(self.cells[j] for j in ids) for ids in self.neighbors]
+
+        # rays[i][d] lists the ids met walking from i in direction d, stopping at the edge of the board.
+        self.rays = []
+        for i in range(self.size):
+            rays = []
+            for d in range(len(self.directions)):
+                ray = []
+                j = self.steps[i][d]
+                while j is not None:
+                    ray.append(j)
+                    j = self.steps[j][d]
+                rays.append(tuple(ray))
+            self.rays.append(tuple(rays))
+
+        # The tables below hold a row per cell, so on big boards each row is only worked out once it's asked for.
+
+        # aligned[i] maps every id on a ray from i to (direction, steps), for finding the ray between two cells.
+        self.aligned = Rows(self.size, self._aligned)
+
+        # distances[i][j] is the number of cells crossed to get from i to j.
+        self.cubic = [(q, -q - r, r) for q, r in self.cells]
+        self.distances = Rows(self.size, self._distances)
+
+        # rings[i][k] holds the ids reachable from i in exactly k steps without leaving the board.
+        self.rings = Rows(self.size, self._rings)
+
+        # Bitboards: cell i is bit i of an int, so sets of cells combine with &, | and & ~.
+        self.bits = [1 << i for i in range(self.size)]
+        self.neighbor_masks = [self.mask(ids) for ids in self.neighbors]
+
+        self._bursts = {}
+        self._line = {}
+        self._lines = {}
+        self._masks = {}
+        for i in range(self.size):
+            for k in range(radius + 1):
+                self.burst(i, k)
+                self.lines(i, k)
+                self.burst_mask(i, k)
+                self.ring_mask(i, k)
+                self.lines_mask(i, k)
+                for d in range(len(self.directions)):
+                    self.ray_mask(i, d, k)
+
+    def _aligned(self, i):
+        return dict((j, (d, steps)) for d, ray in enumerate(self.rays[i]) for steps, j in enumerate(ray, 1))
+
+    def _distances(self, i):
+        a = self.cubic[i]
+        return [(abs(a[0] - b[0]) + abs(a[1] - b[1]) + abs(a[2] - b[2])) // 2 for b in self.cubic]
+
+    def _rings(self, source):
+        return Rings(self.neighbors, source)
+
+    def distance_field(self, sources, blocked=0):
+        """Number of steps from the nearest of the ids in :sources: to every cell, never passing through the cells in
+           the bitboard :blocked:.  Cells that can't be reached are None."""
+        field = [None] * self.size
+        frontier = deque()
+        for i in sources:
+            if field[i] is None:
+                field[i] = 0
+                frontier.append(i)
+        while frontier:
+            current = frontier.popleft()
+            step = field[current] + 1
+            for j in self.neighbors[current]:
+                if field[j] is None and not self.bits[j] & blocked:
+                    field[j] = step
+                    frontier.append(j)
+        return field
+
+    def ring(self, i, k):
+        """The cells exactly :k: steps from cell :i:"""
+        ring = self.rings[i][k:k + 1]
+        return frozenset(self.cells[j] for j in ring[0]) if ring else frozenset()
+
+    def burst(self, i, k):
+        """The cells within :k: steps of cell :i:"""
+        key = (i, k)
+        if key not in self._bursts:
+            self._bursts[key] = frozenset(self.cells[j] for ring in self.rings[i][:k + 1] for j in ring)
+        return self._bursts[key]
+
+    def line(self, i, d, k):
+        """Cell :i: and the cells up to :k: steps from it in direction :d:"""
+        key = (i, d, k)
+        if key not in self._line:
+            self._line[key] = frozenset((self.cells[i],) + tuple(self.cells[j] for j in self.rays[i][d][:k]))
+        return self._line[key]
+
+    def lines(self, i, k):
+        """Cell :i: and the cells up to :k: steps from it in every direction"""
+        key = (i, k)
+        if key not in self._lines:
+            self._lines[key] = frozenset((self.cells[i],) + tuple(self.cells[j] for ray in self.rays[i]
+                                                                   for j in ray[:k]))
+        return self._lines[key]
+
+    def mask(self, ids):
+        """The bitboard holding every id in :ids:"""
+        result = 0
+        for i in ids:
+            result |= self.bits[i]
+        return result
+
+    def ids(self, mask):
+        """Yield the ids set in the bitboard :mask:, lowest first."""
+        while mask:
+            low = mask & -mask
+            yield low.bit_length() - 1
+            mask ^= low
+
+    def adjacent_mask(self, mask):
+        """Bitboard of every cell next to a cell in the bitboard :mask:"""
+        result = 0
+        neighbor_masks = self.neighbor_masks
+        while mask:
+            low = mask & -mask
+            result |= neighbor_masks[low.bit_length() - 1]
+            mask ^= low
+        return result
+
+    def burst_mask(self, i, k):
+        """Bitboard of the cells within :k: steps of cell :i:"""
+        key = ('burst', i, k)
+        if key not in self._masks:
+            self._masks[key] = self.mask(j for ring in self.rings[i][:k + 1] for j in ring)
+        return self._masks[key]
+
+    def ring_mask(self, i, k):
+        """Bitboard of the cells exactly :k: steps from cell :i:"""
+        key = ('ring', i, k)
+        if key not in self._masks:
+            ring = self.rings[i][k:k + 1]
+            self._masks[key] = self.mask(ring[0]) if ring else 0
+        return self._masks[key]
+
+    def nearest(self, i, mask):
+        """Number of steps from cell :i: to the nearest cell in the bitboard :mask:, or None if it's empty"""
+        k = 0
+        while mask:
+            ring = self.ring_mask(i, k)
+            if ring & mask:
+                return k
+            if not ring:    # Past the edge of the board
+                return None
+            k += 1
+        return None
+
+    def ray_mask(self, i, d, k):
+        """Bitboard of the first :k: cells from cell :i: in direction :d:, not including :i: itself"""
+        key = ('ray', i, d, k)
+        if key not in self._masks:
+            self._masks[key] = self.mask(self.rays[i][d][:k])
+        return self._masks[key]
+
+    def lines_mask(self, i, k):
+        """Bitboard of cell :i: and the cells up to :k: steps from it in every direction"""
+        key = ('lines', i, k)
+        if key not in self._masks:
+            result = self.bits[i]
+            for d in range(len(self.directions)):
+                result |= self.ray_mask(i, d, k)
+            self._masks[key] = result
+        return self._masks[key]
+
+    def first(self, i, d, mask, k=None):
+        """Line of sight: the number of steps from cell :i: in direction :d: to the first cell in the bitboard :mask:,
+           looking no further than :k: steps (or the edge of the board), or 0 if nothing is in the way."""
+        bits = self.bits
+        steps = 0
+        for j in self.rays[i][d]:
+            steps += 1
+            if k is not None and steps > k:
+                return 0
+            if bits[j] & mask:
+                return steps
+        return 0
+
+    def sector_mask(self, i, d, k):
+        """Bitboard of the cells up to :k: steps from cell :i: in the wedge from direction :d: round to the next
+           direction, edges included and :i: itself not"""
+        key = ('sector', i, d, k)
+        if key not in self._masks:
+            (q, r), n = self.cells[i], len(self.directions)
+            (uq, ur), (vq, vr) = self.directions[d % n], self.directions[(d + 1) % n]
+            self._masks[key] = self.mask(self.index[cell] for cell in
+                                         ((q + a * uq + b * vq, r + a * ur + b * vr)
+                                          for a in range(k + 1) for b in range(k + 1 - a) if a + b)
+                                         if cell in self.index)
+        return self._masks[key]
+
+    def arc_mask(self, i, d, k):
+        """Bitboard of the first :k: cells from cell :i: in direction :d: and the two directions either side of it"""
+        key = ('arc', i, d, k)
+        if key not in self._masks:
+            result = 0
+            for e in range(d - 1, d + 2):
+                result |= self.ray_mask(i, e % len(self.directions), k)
+            self._masks[key] = result
+        return self._masks[key]
+
+
+class Board(Topology):
+    """A board of the given :shape: and :radius:: its cells, the bounds they lie in, where the hero starts, and the
+       lookup tables of a Topology for them.  The shapes are
+
+         "standard"   radius * 2 + 1 rows of radius * 3 cells, slanting the way the rows of the game's own board do.
+                      Radius 4 is the game's own board.
+         "hexagon"    every cell within :radius: steps of (radius, 0).
+
+       Both are convex, so walking in a straight line never leaves the board and comes back.  Tables that cover every
+       cell out to :precompute: steps are built up front, the rest when they're first asked for."""
+
+    SHAPES = ("standard", "hexagon")
+
+    def __init__(self, directions, shape="standard", radius=4, precompute=5):
+        if shape not in self.SHAPES:
+            raise ValueError("Unknown board shape %s" % shape)
+        self.shape = shape
+        self.radius = radius
+        self.precompute = precompute
+
+        if shape == "standard":
+            width = radius * 3
+            cells = [(L, R) for L in range(width) for R in range(-radius, radius + 1) if 0 <= L + R < width]
+            self.start = (width - 2, 0)
+        else:
+            cells = [(L, R) for L in range(radius * 2 + 1) for R in range(-radius, radius + 1)
+                     if abs(L - radius) + abs(R) + abs(L - radius + R) <= radius * 2]
+            self.start = (radius * 2 - 1, 0) if radius else (0, 0)
+        super(Board, self).__init__(cells, directions, precompute)
+
+        # (lowest L, highest L, lowest R, highest R)
+        self.bounds = (min(L for L, R in cells), max(L for L, R in cells),
+                       min(R for L, R in cells), max(R for L, R in cells))
+
+    def __reduce__(self):
+        """Boards are pickled as the arguments that build them."""
+        return (Board, (self.directions, self.shape, self.radius, self.precompute))
+
+    def __deepcopy__(self, memo):
+        """Copies of a state share its board, which never changes."""
+        return self
+
+    def __repr__(self):
+        return "<Board %s %s: %s cells>" % (self.shape, self.radius, self.size)
+
+    # The same queries as the bitboard helpers in grid, for cells of this board.
+
+    def cell_mask(self, cell):
+        return self.bits[self.index[cell]] if cell in self.index else 0
+
+    def to_mask(self, cells):
+        """The bitboard holding every cell in :cells: on this board"""
+        index = self.index
+        return self.mask(index[cell] for cell in cells if cell in index)
+
+    def to_cells(self, mask):
+        """The set of cells held in the bitboard :mask:"""
+        return set(self.cells[i] for i in self.ids(mask))
+
+    def iter_mask(self, mask):
+        """Yield the cells held in the bitboard :mask:, lowest id first"""
+        for i in self.ids(mask):
+            yield self.cells[i]
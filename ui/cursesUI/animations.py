@@ -26,8 +26,8 @@ def get_background():
     return background
 
 
-def render_unit(position, unit, win):
-    row, col = get_offset(position)
+def render_unit(position, unit, win, board=None):
+    row, col = get_offset(position, board)
 
     if unit['type'] == 'Demolitionist':
         data = copy(UNITS['Demolitionist'])
@@ -45,14 +45,14 @@ def render(state):
     win = curses.newwin(28, 58)
 
     for position, item in state.items():
-        render_unit(position, item, win)
+        render_unit(position, item, win, state.board)
     return win
 
 
-def text_path(src, dest):
-    """Given two cells, figure out the path for a given object to pass between them."""
-    sRow, sCol = get_offset(src)
-    tRow, tCol = get_offset(dest)
+def text_path(src, dest, board=None):
+    """Given two cells of :board:, figure out the path for a given object to pass between them."""
+    sRow, sCol = get_offset(src, board)
+    tRow, tCol = get_offset(dest, board)
 
     row_diff = tRow - sRow
     col_diff = tCol - sCol
@@ -67,7 +67,9 @@ def text_path(src, dest):
             yield sRow + int(floor(i * slope)), sCol + i
 
 
-class Animation(object):
+class Animation(utils.with_metaclass(utils.Registry, object)):
+    registry = "animations"     # Subclasses animate the actions they're named after
+
     def __init__(self, action):
         self.action = action
         self.target = action['target']
@@ -75,10 +77,10 @@ class Animation(object):
 
     @classmethod
     def create(cls, action):
-        for klass in utils.all_subclasses(cls):
-            if action.get('type', None) == klass.__name__:
-                logger.info("Creating %s Animation", klass.__name__)
-                return klass(action)
+        klass = utils.Registry.classes[cls.registry].get(action.get('type', None))
+        if klass is not None:
+            logger.info("Creating %s Animation", klass.__name__)
+            return klass(action)
         logger.info("Defaulting to StaticAnimation for %s", action)
         return Static(action)
 
@@ -111,11 +113,11 @@ class Move(Animation):
     def frames(self, state):
         source = state.find(self.element)
 
-        sRow, sCol = get_offset(source)
+        sRow, sCol = get_offset(source, state.board)
         type = self.action["element"]["type"]
 
         # Path to new square
-        for row, col in text_path(source, self.target):
+        for row, col in text_path(source, self.target, state.board):
             def path_to_move(screen):
                 screen.addstr(sRow, sCol, "__", curses.A_DIM)
                 screen.addstr(row, col, *UNITS[type])
@@ -131,11 +133,11 @@ class ThrowBomb(Animation):
     def frames(self, state):
         source = state.find(self.element)
 
-        sRow, sCol = get_offset(source)
+        sRow, sCol = get_offset(source, state.board)
         type = self.action["element"]["type"]
 
         # Path to new square
-        for row, col in text_path(source, self.target):
+        for row, col in text_path(source, self.target, state.board):
             def path_to_stab(screen):
                 screen.addstr(sRow, sCol+1, "_", curses.A_DIM)
                 screen.addstr(row, col, *UNITS['Bomb'])
@@ -149,24 +151,30 @@ class Die(Animation):
         pass
 
 
+class Cooldown(Animation):
+
+    def render(self, screen, state):
+        pass
+
+
 class Stab(Animation):
 
     def frames(self, state):
         source = state.find(self.element)
 
-        sRow, sCol = get_offset(source)
-        tRow, tCol = get_offset(self.target)
+        sRow, sCol = get_offset(source, state.board)
+        tRow, tCol = get_offset(self.target, state.board)
         type = self.action["element"]["type"]
 
         # Path to Stab
-        for row, col in text_path(source, self.target):
+        for row, col in text_path(source, self.target, state.board):
             def path_to_stab(screen):
                 screen.addstr(sRow, sCol, "__", curses.A_DIM)
                 screen.addstr(row, col, *UNITS[type])
             yield path_to_stab
 
         # Path from Stab
-        for row, col in text_path(self.target, source):
+        for row, col in text_path(self.target, source, state.board):
             def path_from_stab(screen):
                 screen.addstr(sRow, sCol, "__", curses.A_DIM)
                 if state[self.target]['health'] - self.action.damage <= 0:
@@ -186,7 +194,7 @@ class Lunge(Stab):
 class Shoot(Animation):
     def frames(self, state):
         source = state.find(self.element)
-        for row, col in text_path(source, self.target):
+        for row, col in text_path(source, self.target, state.board):
             def frame(screen):
                 screen.addstr(row, col, '|', COLORS['BLUE'] | curses.A_BOLD)
             yield frame
@@ -199,7 +207,7 @@ class Explode(Animation):
 
         for frame in animation:
             def draw_flame(screen):
-                sRow, sCol = get_offset(self.target)
+                sRow, sCol = get_offset(self.target, state.board)
                 screen.addstr(sRow, sCol + 1 - len(frame)/2, frame, COLORS['FIRE'])
             yield draw_flame
 
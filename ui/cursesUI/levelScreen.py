@@ -6,6 +6,7 @@ import textwrap
 import json
 
 import engine
+import search
 import shared
 from ui.cursesUI import offset
 from ui.cursesUI.animations import Animation, Static as StaticAnimation
@@ -17,6 +18,7 @@ import logging
 logger = logging.getLogger(__name__)
 
 MAX_LEVELS = 9
+HINT_SECONDS = 1.0     # How long the hint command searches for
 
 
 class QuitError(utils.HopliteError):
@@ -68,7 +70,7 @@ class LevelScreen(object):
 
     def highlight_char(self, screen):
         """Wrapper function for everything required to highlight a given cell."""
-        r, c = offset.get_offset(self.engine.state.find(self.engine.state.actors[0]))
+        r, c = offset.get_offset(self.engine.state.find(self.engine.state.actors[0]), self.engine.state.board)
         attrs = (screen.inch(r, c) & curses.A_ATTRIBUTES) | curses.A_REVERSE
         screen.chgat(r, c, 1, attrs)
 
@@ -95,6 +97,13 @@ class LevelScreen(object):
         if command.lower() == "quit":
             raise QuitError
 
+        if command.lower() == "hint":
+            result = search.Search(budget=HINT_SECONDS)(self.engine.state)
+            self.message(screen, "Try %s %s (searched %d turns, %.0f/sec)."
+                         % (result.action['type'], tuple(result.action.target), result.nodes,
+                            search.nodes_per_second(result)))
+            return None
+
         try:
             name, location = command.split(" ", 1)
             location = ast.literal_eval(location.strip())
@@ -137,12 +146,12 @@ class LevelScreen(object):
 
         except QuitError:
             with open(utils.data_file("autosave.json"), 'w') as f:
-                f.write(json.dumps(self.engine.past, indent=2))
+                f.write(json.dumps(list(self.engine.past), indent=2))
             from ui.cursesUI.titleScreen import TitleScreen
             return TitleScreen()
         except:
             with open(utils.data_file("autosave.json"), 'w') as f:
-                f.write(json.dumps(self.engine.past, indent=2))
+                f.write(json.dumps(list(self.engine.past), indent=2))
                 raise
 
         if self.engine.complete and 'red' in self.engine.remaining_teams:
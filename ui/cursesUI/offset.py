@@ -1,4 +1,5 @@
 from utils import HopliteError
+import grid
 import math
 
 
@@ -6,17 +7,32 @@ class InvalidPositionError(HopliteError):
     pass
 
 
-def get_offset(pos):
+ORIGINS = {}    # Board -> origin
+
+
+def origin(board=None):
+    """The screen row and column of the cell (0, 0) of :board:, so that its top row and leftmost column are the same
+       distance from the corner of the screen whatever its shape."""
+    board = board or grid.BOARD
+    if board not in ORIGINS:
+        first_L, last_L, first_R, last_R = board.bounds
+        ORIGINS[board] = (4 - min(2 * L + R for L, R in board.cells), 4 - first_R * 6)
+    return ORIGINS[board]
+
+
+def get_offset(pos, board=None):
     L, R = pos
-    row = 4 + 2 * L + R
-    col = 28 + R * 6
+    top, left = origin(board)
+    row = top + 2 * L + R
+    col = left + R * 6
     return row, col
 
 
-def get_cell(row, col):
+def get_cell(row, col, board=None):
     if col % 6 == 1:
         raise InvalidPositionError()
+    top, left = origin(board)
     row, col = float(row), float(col)
-    R = int(math.ceil((col - 30) / 6))
-    L = int(math.ceil((row - 4 - R) / 2))
+    R = int(math.ceil((col - left - 2) / 6))
+    L = int(math.ceil((row - top - R) / 2))
     return (L, R)
@@ -3,6 +3,8 @@ import json
 
 import utils
 import abilities
+import actions  # Files the action classes shared.CreateAction makes
+from shared import CreateAction
 
 
 import logging
@@ -12,28 +14,51 @@ logger = logging.getLogger(__name__)
 with open(utils.data_file("elements.json")) as f:
     INITIAL_DATA = json.load(f)
 
+# The fields every unit of a type starts with, made once and shared by all of them.  Lists become tuples, so no unit
+# can change what the others start with.
+PROTOTYPES = dict((type, tuple((key, tuple(value) if isinstance(value, list) else value)
+                               for key, value in data.items()))
+                  for type, data in INITIAL_DATA.items())
+
 
 class RequiresInput(utils.HopliteError):
     """Error used to notify the UI that the current actor requires user input"""
     pass
 
 
-class Unit(dict):
+class Unit(utils.with_metaclass(utils.Registry, utils.Slotted, dict)):
     """Class used for all Game Elements (With the exception of heroes, who subclass it).
-       It's implemented following a Entity-Component Model."""
+       It's implemented following a Entity-Component Model.
+       The fields are the unit's dict, which is what gets saved.  Everything else lives in slots: the State it is on,
+       and its abilities resolved to flags and classes once, from a cache shared by every unit with the same list."""
+
+    registry = "units"  # Subclasses are used by shared.CreateUnit for units of the type they're named after
+    __slots__ = ('watcher', 'flags', 'ability_classes')
+    transient = ('watcher',)    # Copies of a unit aren't on any State until they are placed on one.
 
     # Create a counter for each type of game element.  Used to assign IDs.
     counters = defaultdict(lambda: utils.Counter())
 
+    def __new__(cls, *args, **kwargs):
+        self = super(Unit, cls).__new__(cls, *args, **kwargs)
+        self.watcher = None     # The State this unit is on, which wants to hear about changes before and after.
+        return self
+
     def __init__(self, **kwargs):
-        super(Unit, self).__init__(**kwargs)
         type = kwargs['type']               # Grab type from kwargs, for cleanliness
-        initial_data = INITIAL_DATA[type]   # Get the Unit's INITIAL_DATA
-
-        self.update(initial_data)           # Set the initial data for the unit
-        self.update(kwargs)                 # Override any data that was in different in the save.
+        super(Unit, self).__init__(PROTOTYPES[type], **kwargs)     # The type's fields, overridden by any in kwargs
         if 'id' not in self:                # Define an ID using the next number in the counter if not defined.
-            self['id'] = "%s-%s" % (type, self.counters[type].next())
+            self['id'] = "%s-%s" % (type, next(self.counters[type]))
+        self.flags, self.ability_classes = abilities.resolve(self['abilities'])
+
+    def __setitem__(self, key, value):
+        if self.watcher is not None:
+            self.watcher.changing(self)
+        super(Unit, self).__setitem__(key, value)
+        if key == 'abilities':
+            self.flags, self.ability_classes = abilities.resolve(value)
+        if self.watcher is not None:
+            self.watcher.changed(self)
 
     def __repr__(self):
         """Represent the unit clearly in debug messages"""
@@ -46,38 +71,78 @@ class Unit(dict):
     @property
     def abilities(self):
         """Helper method to get the actual ability object for every unit's abilities"""
-        return [getattr(abilities, ability) for ability in self['abilities']]
+        return self.ability_classes
+
+    def has(self, ability):
+        """Whether this unit has the ability called :ability:"""
+        return self.flags & abilities.FLAGS[ability] != 0
 
     def get_action(self, state):
         """For AI controlled actors, find an action by looking through each
-           ability and seeing if it suggests and action at this time."""
+           ability and seeing if it suggests and action at this time.
+           If the state has a transposition table, the decision is remembered against the state's hash and reused
+           the next time this unit is in the same position.  Steps aren't remembered: Move breaks ties between
+           equally good cells with the random module, and reusing a step would skip that draw."""
+        table = state.transpositions
+        if table is None:
+            return self.decide(state)
+
+        key = state.zobrist_key()
+        remembered = table.lookup(key, default=None)
+        if remembered is not None:
+            return [CreateAction(dict(action, element=self)) for action in remembered] or None
+
+        actions = self.decide(state)
+        if not any(action['type'] == "Move" for action in actions or []):
+            table.store(key, [dict((k, v) for k, v in action.items() if k != 'element') for action in actions or []])
+        return actions
+
+    def decide(self, state):
+        """Work out this unit's actions from scratch.
+           Cooldowns still above zero tick down as part of the turn, so that replaying the turn reproduces them."""
+        actions = []
         for ability in self.abilities:
-            action = ability.get_action(self, state)
-            if action:
-                return action
-        return None
+            if hasattr(ability, "get_action"):
+                actions = ability.get_action(self, state)
+                if actions:
+                    break
+        ticks = [CreateAction({"type": "Cooldown",
+                               "element": self,
+                               "target": state.find(self),
+                               "cooldown": key}) for key in sorted(self) if key.endswith(" cooldown") and self[key] > 0]
+        return ticks + (actions or []) or None
 
     def threatened_cells(self, state):
         """Helper method for determining all cells from which this Unit can attack opponents.
            This is particularly helpful for the Move action which uses this to find a cells to move towards."""
-        results = set()
+        return state.board.to_cells(self.threat_mask(state))
+
+    def threat_mask(self, state):
+        """Bitboard version of threatened_cells"""
+        results = 0
         for ability in self.abilities:
-            if hasattr(ability, "threatened_cells"):
-                results |= ability.threatened_cells(self, state)
+            if hasattr(ability, "threat_mask"):
+                results |= ability.threat_mask(self, state)
         return results
 
     def targets(self, state):
         """Helper method for determining all cells this Unit can Attack at it's next turn."""
-        results = set()
+        return state.board.to_cells(self.target_mask(state))
+
+    def target_mask(self, state):
+        """Bitboard version of targets"""
+        results = 0
         for ability in self.abilities:
-            if hasattr(ability, "targets"):
-                results |= ability.targets(self, state)
+            if hasattr(ability, "target_mask"):
+                results |= ability.target_mask(self, state)
         return results
 
 
 class Hero(Unit):
     """A special case of a Unit, this unit requires user input to determine it's actions."""
 
+    __slots__ = ('next_action',)
+
     def __init__(self, **kwargs):
         super(Hero, self).__init__(**kwargs)
         self.next_action = None     # self.next_action is the sentinel to determine if the actor has it's next action.
@@ -24,6 +24,53 @@ def all_subclasses(cls):
                                    for g in all_subclasses(s)]
 
 
+class Registry(type):
+    """Metaclass that files every class made with it by name, so an instance can be created from a name with one dict
+       lookup rather than a search through all_subclasses.  The class at the root of a hierarchy names the registry
+       its subclasses go in with a 'registry' attribute, and isn't filed itself.  The registries live here rather
+       than on the classes, so the factories in shared can look classes up without importing the modules that
+       define them."""
+
+    classes = {}    # registry -> {class name: class}
+    roots = {}      # registry -> the class at the root of the hierarchy
+
+    def __init__(cls, name, bases, namespace):
+        super(Registry, cls).__init__(name, bases, namespace)
+        if 'registry' in namespace:
+            Registry.roots[cls.registry] = cls
+            Registry.classes.setdefault(cls.registry, {})
+        elif hasattr(cls, 'registry'):
+            Registry.classes[cls.registry][name] = cls
+
+
+class Slotted(object):
+    """Copying and pickling for classes with __slots__, which have no __dict__ to carry their attributes.  The slots
+       named in :transient: are left out of copies."""
+
+    __slots__ = ()
+    transient = ()
+
+    def __getstate__(self):
+        state = {}
+        for klass in type(self).__mro__:
+            for name in klass.__dict__.get('__slots__', ()):
+                if name not in self.transient and hasattr(self, name):
+                    state[name] = getattr(self, name)
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+
+def with_metaclass(meta, *bases):
+    """Base class for a class made by :meta: with :bases:, written the same way for Python 2 and 3."""
+    class metaclass(type):
+        def __new__(cls, name, this_bases, namespace):
+            return meta(name, bases, namespace)
+    return type.__new__(metaclass, "temporary_class", (), {})
+
+
 def Counter():
     i = 0
     while True:
@@ -0,0 +1,181 @@
+from array import array
+import random
+
+import engine
+import grid
+import planes
+import shared
+import simulator
+import units
+
+import logging
+logger = logging.getLogger(__name__)
+
+# The hero's action space: wait, step in one of the six directions, or jump to one of the twelve cells two away.
+JUMPS = sorted(set(grid.add(a, b) for a in grid.DIRECTIONS for b in grid.DIRECTIONS
+                   if grid.distance((0, 0), grid.add(a, b)) == 2))
+ACTIONS = ([("Null", (0, 0))] + [("Move", offset) for offset in grid.DIRECTIONS]
+           + [("Jump", offset) for offset in JUMPS])
+
+# For each action, the id of the cell it takes the hero to from each cell id, or -1 where that's off the board.
+TARGETS = [array('h', [grid.TOPOLOGY.index.get(grid.add(cell, offset), -1) for cell in grid.TOPOLOGY.cells])
+           for kind, offset in ACTIONS]
+
+KILL_REWARD = 1.0       # For each enemy that died during the step
+DAMAGE_REWARD = -1.0    # For each point of health the hero lost
+WIN_REWARD = 10.0
+LOSS_REWARD = -10.0
+
+
+def popcount(mask):
+    return bin(mask).count("1")
+
+
+class VecEnv(object):
+    """:count: games stepped in lockstep for policy training.
+
+       The games are played by ordinary Engines, so enemy abilities and reactions behave exactly as they do in the
+       game.  Observations are the feature planes each game's state keeps up to date (see State.track_planes), laid
+       one game after another, and the environment only keeps the hero's cell id per game for the action masks.
+
+       Each step plays the games one after another, so this is an interface for training rather than a faster way to
+       play: the environments benchmark puts it level with recording the same turns on a loop of engines and encoding
+       each state from scratch.  EnvPool spreads the games over processes for throughput.
+
+       Games that finish are started again straight away on the next level and seed, so every step returns a full
+       batch.  The standard library's array module stands in for NumPy, which the game doesn't depend on; the arrays
+       support the buffer protocol, so numpy.frombuffer can wrap them without copying where NumPy is available."""
+
+    def __init__(self, count, levels=None, seed=0, max_turns=500, hero="red", stride=1, observations=None):
+        """Successive games are seeded :seed:, :seed: + :stride: and so on, so several environments can share out
+           the seeds between them.  Observations are written into :observations:, any writable buffer of bytes with
+           room for self.shape, such as a view of shared memory; by default the environment makes its own."""
+        self.count = count
+        self.cells = grid.TOPOLOGY.size
+        self.levels = levels or simulator.all_levels()
+        self.seed = seed                # Seed of the next game started
+        self.stride = stride
+        self.max_turns = max_turns
+        self.hero = hero
+
+        self.hero_cells = array('h', [-1]) * count
+
+        self.games = [None] * count
+        self.heroes = [None] * count
+        self.episodes = [None] * count  # (level, seed) of the game each slot is playing
+        self.rewards = array('d', [0.0]) * count
+        self.dones = array('b', [0]) * count
+        if observations is None:
+            observations = bytearray(count * self.cells * len(planes.PLANES))
+        self.observations = observations
+
+    @property
+    def shape(self):
+        """Shape of the observations: games, planes, cells."""
+        return (self.count, len(planes.PLANES), self.cells)
+
+    def reset(self):
+        """Start a new game in every slot and return the observations."""
+        for g in range(self.count):
+            self.start(g)
+        return self.observe()
+
+    def start(self, g):
+        """Start the next game in slot :g: and play it up to the hero's first turn."""
+        level = self.levels[self.seed % len(self.levels)]
+        game = engine.Engine(engine.generate_level(level, random.Random(self.seed)))
+        game.state.track_planes(self.hero)
+        game.fast_forward()
+        self.games[g] = game
+        self.heroes[g] = game.current_actor
+        self.episodes[g] = (level, self.seed)
+        self.seed += self.stride
+        self.advance(g)
+        self.locate(g)
+
+    def advance(self, g):
+        """Play game :g: until the hero needs to act or the game is over."""
+        game = self.games[g]
+        while not self.finished(g):
+            try:
+                game.record()
+            except units.RequiresInput:
+                return
+
+    def finished(self, g):
+        game = self.games[g]
+        return game.complete or game.turn >= self.max_turns or self.heroes[g]['id'] not in game.state.positions
+
+    def action_masks(self):
+        """For each game and each of ACTIONS, 1 if the hero may take it now."""
+        masks = array('b', [0]) * (self.count * len(ACTIONS))
+        bits = grid.TOPOLOGY.bits
+        for g in range(self.count):
+            src = self.hero_cells[g]
+            occupancy = self.games[g].state.occupancy
+            base = g * len(ACTIONS)
+            masks[base] = 1
+            for a in range(1, len(ACTIONS)):
+                target = TARGETS[a][src]
+                if target >= 0 and not bits[target] & occupancy:
+                    masks[base + a] = 1
+        return masks
+
+    def step(self, actions):
+        """Play the hero action with index :actions:[g] into ACTIONS in every game g, then let the enemies act until
+           the hero is needed again.  Actions the hero can't take are played as waiting.
+           Returns (observations, rewards, dones, infos), where infos holds a dict per game noting invalid actions
+           and, for games that just finished, how they ended.  Finished games are restarted before returning."""
+        infos = []
+        for g in range(self.count):
+            infos.append(self.play(g, actions[g]))
+        return self.observe(), self.rewards, self.dones, infos
+
+    def play(self, g, index):
+        game = self.games[g]
+        state = game.state
+        hero = self.heroes[g]
+        src = self.hero_cells[g]
+        target = TARGETS[index][src]
+        invalid = bool(index != 0 and (target < 0 or grid.TOPOLOGY.bits[target] & state.occupancy))
+        if invalid:
+            index, target = 0, src
+
+        enemies = popcount(state.enemy_mask(self.hero))
+        health = hero['health']
+        hero.set_next_action(shared.CreateAction({"type": ACTIONS[index][0],
+                                                  "element": hero,
+                                                  "target": grid.TOPOLOGY.cells[target]}))
+        self.advance(g)
+
+        reward = KILL_REWARD * (enemies - popcount(state.enemy_mask(self.hero)))
+        reward += DAMAGE_REWARD * (health - max(hero['health'], 0))
+        info = {"invalid": invalid}
+        done = self.finished(g)
+        if done:
+            winner = list(game.remaining_teams)[0] if game.complete else None
+            if winner == self.hero:
+                reward += WIN_REWARD
+            elif winner is not None:
+                reward += LOSS_REWARD
+            level, seed = self.episodes[g]
+            info.update(level=level, seed=seed, winner=winner, turns=game.turn)
+            self.start(g)
+        else:
+            self.locate(g)
+
+        self.rewards[g] = reward
+        self.dones[g] = done
+        return info
+
+    def locate(self, g):
+        """Note the cell id the hero of game :g: stands on, or -1 if it is no longer on the board."""
+        hero = self.games[g].state.positions.get(self.heroes[g]['id'])
+        self.hero_cells[g] = -1 if hero is None else grid.TOPOLOGY.index[hero]
+
+    def observe(self):
+        """The feature planes of every game, one after the other, as the flat buffer of shape self.shape."""
+        stride = len(planes.PLANES) * self.cells
+        for g, game in enumerate(self.games):
+            self.observations[g * stride:(g + 1) * stride] = game.state.planes.view()
+        return self.observations
@@ -0,0 +1,137 @@
+import random
+
+import grid
+from planes import COOLDOWNS
+
+import logging
+logger = logging.getLogger(__name__)
+
+SEED = "hoplite-zobrist"
+
+
+class Keys(dict):
+    """Random 64 bit keys, a list with one per cell id for each feature, made the first time the feature turns up.
+       Each list is seeded from the feature itself, so every process agrees on the keys whatever order it meets them
+       in, and a list made longer for a bigger board starts with the same keys."""
+
+    def __missing__(self, feature):
+        return self.make(feature, grid.TOPOLOGY.size)
+
+    def make(self, feature, size):
+        rng = random.Random("%s %r" % (SEED, feature))
+        keys = [rng.getrandbits(64) for i in range(size)]
+        self[feature] = keys
+        return keys
+
+
+KEYS = Keys()
+BEAM, BOMB = COOLDOWNS
+
+
+def unit_key(cell, unit, board=None):
+    """What :unit: standing in :cell: of :board: (the game's own by default) contributes to the hash.  Every distinct
+       combination of type, team, health and cooldowns gets its own keys, one per cell."""
+    board = board or grid.BOARD
+    i = board.index.get(cell)
+    if i is None:
+        return 0
+    feature = (unit['type'], unit.get('team'), unit.get('health'), unit.get(BEAM, 0), unit.get(BOMB, 0))
+    keys = KEYS[feature]
+    if i >= len(keys):
+        keys = KEYS.make(feature, board.size)
+    return keys[i]
+
+
+def turn_key(state):
+    """What whose turn it is contributes to the hash, keyed by the cell the next actor stands in."""
+    if not state.actors:
+        return 0
+    return unit_key(state.positions.get(state.actors[0]['id']), {'type': "turn"}, state.board)
+
+
+def compute(state):
+    """The hash of :state: worked out from scratch, which State.zobrist_key keeps up to date incrementally."""
+    key = 0
+    for cell, unit in state.items():
+        key ^= unit_key(cell, unit, state.board)
+    return key ^ turn_key(state)
+
+
+MISSING = object()
+
+
+class TranspositionTable(object):
+    """A bounded cache of values keyed by Zobrist hash, shared by anything that wants to remember what it worked out
+       for a state: searches store evaluations with the depth they searched to, and enemy decisions store their
+       actions at depth zero.
+
+       The table has :capacity: slots in buckets of :ways:.  A key can only live in its own bucket, so when the bucket
+       is full something has to go: an entry from an earlier generation (see new_generation) if there is one,
+       otherwise the shallowest.  A deeper entry for the same key replaces a shallower one, but not the reverse."""
+
+    def __init__(self, capacity=1 << 16, ways=4):
+        self.ways = ways
+        self.buckets = max(1, capacity // ways)
+        self.keys = [None] * (self.buckets * ways)
+        self.values = [None] * (self.buckets * ways)
+        self.depths = [0] * (self.buckets * ways)
+        self.ages = [0] * (self.buckets * ways)
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.replaced = 0   # Entries for other keys pushed out to make room
+
+    def __len__(self):
+        return sum(1 for key in self.keys if key is not None)
+
+    def __deepcopy__(self, memo):
+        """Copies of a state go on sharing its table; the table isn't part of the game."""
+        return self
+
+    def new_generation(self):
+        """Mark everything stored so far as old, so it goes first when room is needed.  Searches call this between
+           moves."""
+        self.generation += 1
+
+    def slots(self, key):
+        first = (key % self.buckets) * self.ways
+        return range(first, first + self.ways)
+
+    def lookup(self, key, depth=0, default=MISSING):
+        """The value stored for :key: by something that looked at least :depth: deep, or :default:"""
+        for slot in self.slots(key):
+            if self.keys[slot] == key and self.depths[slot] >= depth:
+                self.hits += 1
+                self.ages[slot] = self.generation
+                return self.values[slot]
+        self.misses += 1
+        return default
+
+    def store(self, key, value, depth=0):
+        slots = self.slots(key)
+        for slot in slots:
+            if self.keys[slot] == key:
+                if depth >= self.depths[slot]:
+                    self.write(slot, key, value, depth)
+                return
+
+        empty = [slot for slot in slots if self.keys[slot] is None]
+        if empty:
+            self.write(empty[0], key, value, depth)
+        else:
+            self.replaced += 1
+            self.write(min(slots, key=self.rank), key, value, depth)
+
+    def write(self, slot, key, value, depth):
+        self.keys[slot] = key
+        self.values[slot] = value
+        self.depths[slot] = depth
+        self.ages[slot] = self.generation
+
+    def rank(self, slot):
+        """How much an occupied slot is worth keeping: current entries before old ones, then deeper before shallower."""
+        return (self.ages[slot] == self.generation, self.depths[slot])
+
+    def clear(self):
+        for slot in range(len(self.keys)):
+            self.write(slot, None, None, 0)